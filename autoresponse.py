@@ -0,0 +1,274 @@
+"""Auto-response engine.
+
+Every non-bot message is checked against the guild's triggers, so matching has
+to stay cheap no matter how many triggers a guild has. Each guild gets a
+compiled ``GuildMatcher``:
+
+- ``exact`` triggers live in a dict keyed by the normalized message text
+- ``contains`` and ``word`` triggers share one Aho-Corasick automaton, so a
+  message is scanned once in time linear in its length (plus matches found)
+
+Matchers are loaded from the ``auto_responses`` table on first use, updated in
+place when triggers are added or removed, and kept in an LRU cache so inactive
+guilds fall out of memory.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+
+MATCH_MODES = ('exact', 'contains', 'word')
+
+
+def normalize(text):
+    return ' '.join(text.lower().split())
+
+
+def _is_word_char(ch):
+    return ch.isalnum() or ch == '_'
+
+
+class Trigger:
+    __slots__ = ('response_id', 'trigger', 'response', 'mode', 'cooldown', 'last_fired')
+
+    def __init__(self, response_id, trigger, response, mode='contains', cooldown=0):
+        self.response_id = response_id
+        self.trigger = trigger
+        self.response = response
+        self.mode = mode
+        self.cooldown = cooldown or 0
+        self.last_fired = float('-inf')
+
+    def ready(self, now):
+        return now - self.last_fired >= self.cooldown
+
+
+class AhoCorasick:
+    """Multi-pattern matcher over a trie with failure links.
+
+    Patterns can be added at any time; they are inserted into the trie right away
+    and the failure links are recomputed lazily on the next scan, so a burst of
+    additions costs one link pass.
+    """
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]         # pattern keys ending exactly at this node
+        self._out_link = [0]     # nearest node on the failure chain with output
+        self._lengths = {}
+        self._dirty = False
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def add(self, pattern, key):
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._out_link.append(0)
+            node = nxt
+        self._out[node].append(key)
+        self._lengths[key] = len(pattern)
+        self._dirty = True
+
+    def _build_links(self):
+        goto, fail, out, out_link = self._goto, self._fail, self._out, self._out_link
+        queue = deque()
+        for nxt in goto[0].values():
+            fail[nxt] = 0
+            out_link[nxt] = 0
+            queue.append(nxt)
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in goto[node].items():
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                f = goto[f].get(ch, 0)
+                fail[nxt] = f if f != nxt else 0
+                out_link[nxt] = fail[nxt] if out[fail[nxt]] else out_link[fail[nxt]]
+                queue.append(nxt)
+        self._dirty = False
+
+    def scan(self, text):
+        """Yield ``(start, end, key)`` for every pattern occurrence, in order of ``end``."""
+        if self._dirty:
+            self._build_links()
+        goto, fail, out, out_link, lengths = self._goto, self._fail, self._out, self._out_link, self._lengths
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            hit = node if out[node] else out_link[node]
+            while hit:
+                for key in out[hit]:
+                    yield i + 1 - lengths[key], i + 1, key
+                hit = out_link[hit]
+
+
+class GuildMatcher:
+    """All auto-response triggers of one guild, compiled for matching."""
+
+    # Rebuild the automaton once removed patterns outnumber live ones
+    REBUILD_RATIO = 1.0
+
+    def __init__(self, triggers=()):
+        self.triggers = {}  # response_id -> Trigger
+        self._by_text = {}  # normalized trigger text -> response_id
+        self._exact = {}    # normalized text -> response_id
+        self._automaton = AhoCorasick()
+        self._removed = 0
+        for trigger in triggers:
+            self.add(trigger)
+
+    def __len__(self):
+        return len(self.triggers)
+
+    def add(self, trigger):
+        old = self.find(trigger.trigger)
+        if old is not None:
+            self.remove(old.response_id)
+        self.triggers[trigger.response_id] = trigger
+        self._by_text[trigger.trigger] = trigger.response_id
+        if trigger.mode == 'exact':
+            self._exact[trigger.trigger] = trigger.response_id
+        else:
+            self._automaton.add(trigger.trigger, trigger.response_id)
+
+    def remove(self, response_id):
+        trigger = self.triggers.pop(response_id, None)
+        if trigger is None:
+            return None
+        self._by_text.pop(trigger.trigger, None)
+        if trigger.mode == 'exact':
+            self._exact.pop(trigger.trigger, None)
+        else:
+            # Leave the pattern in the trie and skip it when scanning; rebuild
+            # once enough dead patterns have piled up.
+            self._removed += 1
+            if self._removed > self.REBUILD_RATIO * max(1, len(self._automaton) - self._removed):
+                self._rebuild()
+        return trigger
+
+    def _rebuild(self):
+        self._automaton = AhoCorasick()
+        for trigger in self.triggers.values():
+            if trigger.mode != 'exact':
+                self._automaton.add(trigger.trigger, trigger.response_id)
+        self._removed = 0
+
+    def find(self, text):
+        response_id = self._by_text.get(normalize(text))
+        return None if response_id is None else self.triggers[response_id]
+
+    def match(self, content, now=None):
+        """Return the first trigger that matches ``content`` and is off cooldown, or None."""
+        if not self.triggers:
+            return None
+        now = time.monotonic() if now is None else now
+        text = normalize(content)
+
+        response_id = self._exact.get(text)
+        if response_id is not None:
+            trigger = self.triggers[response_id]
+            if trigger.ready(now):
+                return trigger
+
+        for start, end, response_id in self._automaton.scan(text):
+            trigger = self.triggers.get(response_id)
+            if trigger is None or not trigger.ready(now):
+                continue
+            if trigger.mode == 'word' and (
+                    (start > 0 and _is_word_char(text[start - 1])) or
+                    (end < len(text) and _is_word_char(text[end]))):
+                continue
+            return trigger
+        return None
+
+
+class AutoResponder:
+    """Per-guild matchers backed by the ``auto_responses`` table, with LRU eviction."""
+
+    def __init__(self, db, max_guilds=None):
+        self.db = db
+        self.max_guilds = max_guilds or int(os.getenv('AUTORESPONSE_CACHE_GUILDS', '1000'))
+        self._cache = OrderedDict()  # guild_id -> GuildMatcher
+        self._loading = {}           # guild_id -> Future, so a burst of messages loads once
+
+    async def get_matcher(self, guild_id):
+        guild_id = str(guild_id)
+        matcher = self._cache.get(guild_id)
+        if matcher is not None:
+            self._cache.move_to_end(guild_id)
+            return matcher
+
+        pending = self._loading.get(guild_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._loading[guild_id] = future
+        try:
+            rows = await self.db.fetchall(
+                'SELECT response_id, trigger, response, match_mode, cooldown FROM auto_responses WHERE guild_id = ?',
+                (guild_id,))
+            matcher = GuildMatcher(Trigger(*row) for row in rows)
+            self._cache[guild_id] = matcher
+            while len(self._cache) > self.max_guilds:
+                self._cache.popitem(last=False)
+            future.set_result(matcher)
+            return matcher
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Mark retrieved; waiters get it via shield
+            raise
+        finally:
+            del self._loading[guild_id]
+
+    async def add(self, guild_id, trigger, response, mode='contains', cooldown=0):
+        """Add or replace a trigger. Returns the stored Trigger."""
+        if mode not in MATCH_MODES:
+            raise ValueError(f"Unknown match mode: {mode}")
+        trigger = normalize(trigger)
+        if not trigger:
+            # An empty pattern ends at the automaton's root and could never fire
+            raise ValueError("Trigger is empty")
+        response_id = await self.db.execute(
+            'INSERT OR REPLACE INTO auto_responses (guild_id, trigger, response, match_mode, cooldown) VALUES (?, ?, ?, ?, ?)',
+            (str(guild_id), trigger, response, mode, cooldown))
+        entry = Trigger(response_id, trigger, response, mode, cooldown)
+        matcher = self._cache.get(str(guild_id))
+        if matcher is not None:
+            matcher.add(entry)
+        return entry
+
+    async def remove(self, guild_id, trigger):
+        """Remove a trigger by its text. Returns True if one was removed."""
+        matcher = await self.get_matcher(guild_id)
+        entry = matcher.find(trigger)
+        if entry is None:
+            return False
+        await self.db.execute('DELETE FROM auto_responses WHERE response_id = ?', (entry.response_id,))
+        matcher.remove(entry.response_id)
+        return True
+
+    async def list(self, guild_id):
+        matcher = await self.get_matcher(guild_id)
+        return sorted(matcher.triggers.values(), key=lambda t: t.trigger)
+
+    async def match(self, guild_id, content):
+        """Return the trigger to fire for this message and start its cooldown, or None."""
+        matcher = await self.get_matcher(guild_id)
+        now = time.monotonic()
+        trigger = matcher.match(content, now)
+        if trigger is not None:
+            trigger.last_fired = now
+        return trigger
@@ -0,0 +1,133 @@
+"""Per-guild index of banned users for /unban.
+
+``guild.bans()`` is a paginated REST iterator, so scanning it on every /unban
+gets slow in guilds with large ban lists. Lookups here stream the pages and stop
+at the first match, remembering every entry they see. Once a guild's list has
+been read to the end the index is marked complete, and from then on
+``on_member_ban``/``on_member_unban`` keep it current, so lookups and
+autocomplete need no REST calls at all.
+"""
+import asyncio
+import logging
+
+import discord
+
+log = logging.getLogger(__name__)
+
+
+def user_label(user):
+    if user.discriminator and user.discriminator != '0':
+        return f"{user.name}#{user.discriminator}"
+    return user.name
+
+
+class GuildBans:
+    __slots__ = ('users', 'complete', 'loading')
+
+    def __init__(self):
+        self.users = {}       # user_id -> discord.User
+        self.complete = False
+        self.loading = None   # background full load, if one is running
+
+    def find(self, query):
+        """Match a user ID, username, display name or legacy name#discriminator tag."""
+        if query.isdigit():
+            return self.users.get(int(query))
+        query = query.lower()
+        for user in self.users.values():
+            if _matches(user, query):
+                return user
+        return None
+
+
+def _matches(user, query):
+    """``query`` must already be lower-cased."""
+    return (user.name.lower() == query or
+            f"{user.name}#{user.discriminator}".lower() == query or
+            (user.global_name is not None and user.global_name.lower() == query))
+
+
+class BanIndex:
+    def __init__(self):
+        self._guilds = {}  # guild_id -> GuildBans
+
+    def _get(self, guild_id):
+        bans = self._guilds.get(guild_id)
+        if bans is None:
+            bans = self._guilds[guild_id] = GuildBans()
+        return bans
+
+    def add(self, guild_id, user):
+        self._get(guild_id).users[user.id] = user
+
+    def remove(self, guild_id, user_id):
+        bans = self._guilds.get(guild_id)
+        if bans is not None:
+            bans.users.pop(user_id, None)
+
+    def forget_guild(self, guild_id):
+        self._guilds.pop(guild_id, None)
+
+    async def _stream(self, guild, query=None):
+        """Read the guild's ban list page by page, stopping at the first match for ``query``."""
+        bans = self._get(guild.id)
+        async for entry in guild.bans(limit=None):
+            bans.users[entry.user.id] = entry.user
+            if query is not None and _matches(entry.user, query):
+                return entry.user
+        bans.complete = True
+        return None
+
+    async def find(self, guild, query):
+        """Return the banned ``discord.User`` matching ``query``, or None."""
+        query = query.strip()
+        bans = self._get(guild.id)
+        user = bans.find(query)
+        if user is not None:
+            return user
+
+        if query.isdigit():
+            # A direct lookup is one request no matter how long the ban list is. Done
+            # even for a complete index, which misses bans made while the gateway was
+            # reconnecting.
+            try:
+                entry = await guild.fetch_ban(discord.Object(id=int(query)))
+            except discord.NotFound:
+                return None
+            bans.users[entry.user.id] = entry.user
+            return entry.user
+
+        if bans.complete:
+            return None
+        return await self._stream(guild, query.lower())
+
+    def ensure_loaded(self, guild):
+        """Start a background full load of the guild's ban list if it hasn't been read yet."""
+        bans = self._get(guild.id)
+        if bans.complete or bans.loading is not None:
+            return
+
+        async def load():
+            try:
+                await self._stream(guild)
+            except Exception as e:
+                log.error(f"Error loading ban list for guild {guild.id}: {e}")
+            finally:
+                bans.loading = None
+
+        bans.loading = asyncio.create_task(load())
+
+    def autocomplete(self, guild_id, current, limit=25):
+        """Return up to ``limit`` indexed users whose ID, name or tag contains ``current``."""
+        bans = self._guilds.get(guild_id)
+        if bans is None:
+            return []
+        current = current.strip().lower()
+        results = []
+        for user in bans.users.values():
+            if (not current or current in str(user.id) or current in user_label(user).lower() or
+                    (user.global_name is not None and current in user.global_name.lower())):
+                results.append(user)
+                if len(results) >= limit:
+                    break
+        return results
@@ -0,0 +1,280 @@
+"""Stand-ins for the discord.py objects the bot's handlers touch.
+
+Every method that would be a REST call in discord.py sleeps for a simulated
+latency instead (``Rest.latency`` seconds, +/- ``Rest.jitter``), and counts the
+call per route so a run can report how many requests a scenario made.
+Only the attributes the handlers actually use are implemented.
+"""
+import asyncio
+import datetime
+import itertools
+import random
+from collections import Counter
+
+import discord
+
+_ids = itertools.count(1_000_000_000_000_000_000)
+
+
+def next_id():
+    return next(_ids)
+
+
+class Rest:
+    """Simulated REST latency shared by every fake object."""
+
+    latency = 0.05
+    jitter = 0.2
+    calls = Counter()
+
+    @classmethod
+    async def call(cls, route):
+        cls.calls[route] += 1
+        delay = cls.latency * random.uniform(1 - cls.jitter, 1 + cls.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class FakeRole:
+    def __init__(self, name, guild):
+        self.id = next_id()
+        self.name = name
+        self.guild = guild
+        self.mention = f'<@&{self.id}>'
+
+
+class FakeUser:
+    def __init__(self, name=None, bot=False, guild=None):
+        self.id = next_id()
+        self.name = name or f'user{self.id % 100000}'
+        self.discriminator = '0'
+        self.global_name = None
+        self.bot = bot
+        self.guild = guild
+        self.roles = []
+        self.mention = f'<@{self.id}>'
+        self.guild_permissions = discord.Permissions.none()
+        self._timed_out_until = None
+
+    async def kick(self, reason=None):
+        await Rest.call('kick')
+
+    async def ban(self, reason=None):
+        await Rest.call('ban')
+
+    async def add_roles(self, *roles, reason=None):
+        await Rest.call('add_roles')
+        self.roles.extend(roles)
+
+    async def remove_roles(self, *roles, reason=None):
+        await Rest.call('remove_roles')
+        self.roles = [r for r in self.roles if r not in roles]
+
+    async def timeout(self, until, reason=None):
+        await Rest.call('timeout')
+        self._timed_out_until = until
+
+    def is_timed_out(self):
+        return self._timed_out_until is not None
+
+
+class FakeMessage:
+    def __init__(self, channel, author, content='', created_at=None, state=None):
+        self.id = next_id()
+        self.channel = channel
+        self.guild = channel.guild if channel is not None else None
+        self.author = author
+        self.content = content
+        self.created_at = created_at or discord.utils.utcnow()
+        self.pinned = False
+        self.attachments = []
+        self.embeds = []
+        # Needed by commands.Bot.get_context in on_message
+        self._state = state
+
+    async def edit(self, content=None, **kwargs):
+        await Rest.call('edit_message')
+        self.content = content
+
+    async def delete(self):
+        await Rest.call('delete_message')
+        self.channel.messages.remove(self)
+
+
+class _ChannelMixin:
+    def _init_channel(self, name, guild):
+        self.id = next_id()
+        self.name = name
+        self.guild = guild
+        self._overwrites = {}
+
+    def overwrites_for(self, target):
+        return self._overwrites.get(target.id, discord.PermissionOverwrite())
+
+    async def set_permissions(self, target, *, overwrite=None, reason=None, **perms):
+        await Rest.call('set_permissions')
+        self._overwrites[target.id] = overwrite if overwrite is not None else discord.PermissionOverwrite(**perms)
+
+
+class FakeCategory(_ChannelMixin, discord.CategoryChannel):
+    # Subclasses discord.CategoryChannel so the handlers' isinstance checks pass
+    # (mention and channels come from discord.CategoryChannel's own properties)
+    def __init__(self, name, guild):
+        self._init_channel(name, guild)
+        self.category_id = None
+        self.position = len(guild.channels)
+
+    def __repr__(self):
+        return f'<FakeCategory {self.name}>'
+
+
+class FakeTextChannel(_ChannelMixin):
+    def __init__(self, name, guild, category=None):
+        self._init_channel(name, guild)
+        self.category = category
+        self.category_id = category.id if category else None
+        self.mention = f'<#{self.id}>'
+        self.messages = []  # oldest first
+
+    def __repr__(self):
+        return f'<FakeTextChannel {self.name}>'
+
+    async def send(self, content=None, *, embed=None, view=None, **kwargs):
+        await Rest.call('send_message')
+        message = FakeMessage(self, self.guild.me, content or '')
+        self.messages.append(message)
+        return message
+
+    def history(self, *, limit=100, before=None, after=None, oldest_first=None):
+        channel = self
+
+        async def pages():
+            remaining = limit
+            before_id = before.id if before else None
+            after_id = after.id if after else 0
+            # Newest first, 100 per simulated request like the real iterator
+            candidates = [m for m in reversed(channel.messages)
+                          if (before_id is None or m.id < before_id) and m.id > after_id]
+            if oldest_first:
+                candidates.reverse()
+            for start in range(0, len(candidates), 100):
+                await Rest.call('history')
+                for message in candidates[start:start + 100]:
+                    if remaining is not None and remaining <= 0:
+                        return
+                    yield message
+                    if remaining is not None:
+                        remaining -= 1
+
+        return pages()
+
+    @property
+    def last_message_id(self):
+        return self.messages[-1].id if self.messages else None
+
+    async def delete(self, *, reason=None):
+        await Rest.call('delete_channel')
+        self.guild.channels.remove(self)
+
+    async def delete_messages(self, messages, *, reason=None):
+        await Rest.call('bulk_delete' if len(messages) > 1 else 'delete_message')
+        doomed = {m.id for m in messages}
+        self.messages = [m for m in self.messages if m.id not in doomed]
+
+
+class FakeGuild:
+    def __init__(self, name='bench-guild', categories=0, channels_per_category=0):
+        self.id = next_id()
+        self.name = name
+        self.icon = None
+        self.default_role = FakeRole('@everyone', self)
+        self.me = FakeUser('bench-bot', bot=True, guild=self)
+        self.roles = [self.default_role]
+        self.channels = []
+        self.members = {}
+        for i in range(categories):
+            category = FakeCategory(f'category-{i}', self)
+            self.channels.append(category)
+            for j in range(channels_per_category):
+                self.channels.append(FakeTextChannel(f'channel-{i}-{j}', self, category))
+
+    @property
+    def categories(self):
+        return [c for c in self.channels if isinstance(c, discord.CategoryChannel)]
+
+    def get_channel(self, channel_id):
+        for channel in self.channels:
+            if channel.id == channel_id:
+                return channel
+        return None
+
+    def add_member(self, name=None):
+        member = FakeUser(name, guild=self)
+        self.members[member.id] = member
+        return member
+
+    async def create_text_channel(self, name, *, category=None, overwrites=None, **kwargs):
+        await Rest.call('create_channel')
+        channel = FakeTextChannel(name, self, category)
+        self.channels.append(channel)
+        return channel
+
+    async def create_role(self, *, name, **kwargs):
+        await Rest.call('create_role')
+        role = FakeRole(name, self)
+        self.roles.append(role)
+        return role
+
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def defer(self, *, ephemeral=False, thinking=False):
+        await Rest.call('interaction_callback')
+        self._done = True
+
+    async def send_message(self, content=None, *, embed=None, view=None, ephemeral=False, **kwargs):
+        await Rest.call('interaction_callback')
+        self._done = True
+        self._interaction.sent.append(content)
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self._interaction = interaction
+
+    async def send(self, content=None, *, embed=None, ephemeral=False, wait=False, **kwargs):
+        await Rest.call('followup')
+        self._interaction.sent.append(content)
+        return FakeMessage(self._interaction.channel, self._interaction.guild.me, content or '')
+
+
+class FakeInteraction:
+    def __init__(self, guild, user, channel=None):
+        self.id = next_id()
+        self.guild = guild
+        self.user = user
+        self.channel = channel
+        self.message = None
+        self.created_at = discord.utils.utcnow()
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.sent = []
+
+    async def edit_original_response(self, *, content=None, **kwargs):
+        await Rest.call('edit_original_response')
+        self.sent.append(content)
+
+
+def fill_history(channel, count, author, old_fraction=0.0):
+    """Add ``count`` messages to ``channel``; ``old_fraction`` of them older than 14 days."""
+    now = discord.utils.utcnow()
+    old = int(count * old_fraction)
+    for i in range(count):
+        age = datetime.timedelta(days=30) if i < old else datetime.timedelta(minutes=count - i)
+        channel.messages.append(FakeMessage(channel, author, f'message {i}', created_at=now - age))
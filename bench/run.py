@@ -0,0 +1,319 @@
+"""Offline benchmarks for the bot's handlers.
+
+Imports ``bot.py`` without connecting to Discord, points it at a throwaway local
+SQLite file instead of SQLiteCloud, and drives the real command callbacks and
+``on_message`` through the fake objects in ``fakes.py`` with simulated REST
+latency. Reports p50/p99 latency and throughput per scenario and writes them
+to JSON so runs can be compared::
+
+    python bench/run.py --output bench_results.json
+    python bench/run.py --compare bench_results.json   # exits 1 on a p99 regression
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import string
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Must be set before bot.py is imported: the DB pool and ledger read them at import time
+_tmp = tempfile.mkdtemp(prefix='bot-bench-')
+os.environ['SQLITE_PATH'] = os.path.join(_tmp, 'bot.db')
+os.environ['LEDGER_PATH'] = os.path.join(_tmp, 'economy.db')
+os.environ['PURGE_SINGLE_DELETE_DELAY'] = '0'
+os.environ['TRANSCRIPT_DIR'] = os.path.join(_tmp, 'transcripts')
+# The fakes have no channel-create rate limit to pace for; measure the queue itself
+os.environ.setdefault('TICKET_CREATE_INTERVAL', '0')
+os.environ.setdefault('TICKET_QUEUE_LIMIT', '100000')
+
+import fakes  # noqa: E402
+from fakes import FakeGuild, FakeInteraction, FakeMessage, FakeTextChannel, FakeUser, Rest  # noqa: E402
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.elapsed = 0.0
+
+    async def time(self, coro):
+        started = time.perf_counter()
+        try:
+            await coro
+        except Exception as e:
+            self.errors += 1
+            print(f"  error: {e!r}")
+        self.latencies.append(time.perf_counter() - started)
+
+    def summary(self, rest_calls):
+        values = sorted(self.latencies)
+        return {
+            'count': len(values),
+            'errors': self.errors,
+            'p50_ms': round(percentile(values, 50) * 1000, 3),
+            'p99_ms': round(percentile(values, 99) * 1000, 3),
+            'mean_ms': round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+            'wall_s': round(self.elapsed, 3),
+            'throughput_per_s': round(len(values) / self.elapsed, 2) if self.elapsed else 0.0,
+            'rest_calls': dict(rest_calls),
+        }
+
+
+async def run_scenario(name, body):
+    Rest.calls.clear()
+    recorder = Recorder()
+    started = time.perf_counter()
+    await body(recorder)
+    recorder.elapsed = time.perf_counter() - started
+    result = recorder.summary(Rest.calls)
+    print(f"{name:<24} n={result['count']:<6} p50={result['p50_ms']:>9.3f}ms p99={result['p99_ms']:>9.3f}ms "
+          f"throughput={result['throughput_per_s']:>9.2f}/s errors={result['errors']}")
+    return result
+
+
+async def bench_ticket_burst(bot_module, users):
+    guild = FakeGuild(categories=3)
+    category = guild.categories[0]
+
+    async def body(recorder):
+        async def one(user):
+            select = bot_module.TicketCategorySelect(guild.categories)
+            select._values = [str(category.id)]
+            await recorder.time(select.callback(FakeInteraction(guild, user)))
+        await asyncio.gather(*(one(guild.add_member()) for _ in range(users)))
+
+    return await run_scenario('ticket_burst', body)
+
+
+async def bench_ticket_spam(bot_module, users, clicks):
+    """Every user clicks the panel several times at once; each must end up with one channel."""
+    guild = FakeGuild(categories=1)
+    category = guild.categories[0]
+
+    async def body(recorder):
+        async def one(user):
+            select = bot_module.TicketCategorySelect(guild.categories)
+            select._values = [str(category.id)]
+            await recorder.time(select.callback(FakeInteraction(guild, user)))
+        members = [guild.add_member() for _ in range(users)]
+        await asyncio.gather(*(one(member) for member in members for _ in range(clicks)))
+        duplicates = Rest.calls['create_channel'] - users
+        if duplicates:
+            recorder.errors += abs(duplicates)
+            print(f"  error: {Rest.calls['create_channel']} channels created for {users} users")
+
+    return await run_scenario('ticket_spam', body)
+
+
+async def bench_ticket_close(bot_module, tickets, messages):
+    """Owners close tickets with long histories; the transcripts stream to disk."""
+    guild = FakeGuild(categories=1)
+    category = guild.categories[0]
+    opened = []
+    for _ in range(tickets):
+        user = guild.add_member()
+        select = bot_module.TicketCategorySelect(guild.categories)
+        select._values = [str(category.id)]
+        await select.callback(FakeInteraction(guild, user))
+        channel = guild.channels[-1]
+        fakes.fill_history(channel, messages, user)
+        opened.append((user, channel))
+
+    async def body(recorder):
+        await asyncio.gather(*(recorder.time(bot_module.closeticket.callback(FakeInteraction(guild, user, channel)))
+                               for user, channel in opened))
+        left = [channel for _, channel in opened if channel in guild.channels]
+        if left:
+            recorder.errors += len(left)
+            print(f"  error: {len(left)} ticket channels were not deleted")
+
+    return await run_scenario(f'ticket_close[{messages}msg]', body)
+
+
+async def bench_autoresponse_scan(bot_module, triggers, messages, words=40):
+    guild = FakeGuild()
+    # Seed the table directly; adding thousands of triggers isn't what's being measured
+    conn = sqlite3.connect(os.environ['SQLITE_PATH'])
+    rng = random.Random(1)
+    rows = [(str(guild.id), ''.join(rng.choice(string.ascii_lowercase) for _ in range(8)), 'pong',
+             rng.choice(('exact', 'contains', 'word')), 0) for _ in range(triggers)]
+    conn.executemany('INSERT OR REPLACE INTO auto_responses (guild_id, trigger, response, match_mode, cooldown) '
+                     'VALUES (?, ?, ?, ?, ?)', rows)
+    conn.commit()
+    conn.close()
+
+    channel = FakeTextChannel('general', guild)
+    author = guild.add_member()
+    state = bot_module.bot._connection
+    texts = []
+    for _ in range(messages):
+        text = [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 9))) for _ in range(words)]
+        # About one message in ten hits a trigger and sends a reply
+        if rows and rng.random() < 0.1:
+            text[rng.randrange(words)] = rng.choice(rows)[1]
+        texts.append(' '.join(text))
+
+    async def body(recorder):
+        for text in texts:
+            await recorder.time(bot_module.on_message(FakeMessage(channel, author, text, state=state)))
+
+    return await run_scenario(f'autoresponse_scan[{triggers}]', body)
+
+
+async def bench_mute_fanout(bot_module, categories, channels_per_category, runs):
+    async def body(recorder):
+        for _ in range(runs):
+            guild = FakeGuild(categories=categories, channels_per_category=channels_per_category)
+            member = guild.add_member()
+            await recorder.time(bot_module.mute.callback(FakeInteraction(guild, guild.me), member))
+
+    return await run_scenario(f'mute_fanout[{categories * (channels_per_category + 1)}ch]', body)
+
+
+async def bench_clear(bot_module, messages, runs):
+    async def body(recorder):
+        for _ in range(runs):
+            guild = FakeGuild()
+            channel = FakeTextChannel('spam', guild)
+            fakes.fill_history(channel, messages, guild.add_member(), old_fraction=0.05)
+            interaction = FakeInteraction(guild, guild.me, channel)
+
+            async def purge():
+                await bot_module.clear.callback(interaction, amount=messages)
+                job = bot_module.purge_manager.running(channel.id)
+                if job is not None:
+                    await job.task
+
+            await recorder.time(purge())
+
+    return await run_scenario(f'clear[{messages}]', body)
+
+
+async def bench_kick(bot_module, count):
+    guild = FakeGuild()
+
+    async def body(recorder):
+        await asyncio.gather(*(recorder.time(bot_module.kick.callback(FakeInteraction(guild, guild.me), guild.add_member()))
+                               for _ in range(count)))
+
+    return await run_scenario('kick', body)
+
+
+async def bench_ticket_setup(bot_module, categories, runs):
+    async def body(recorder):
+        for _ in range(runs):
+            guild = FakeGuild(categories=categories)
+            channel = FakeTextChannel('panel', guild)
+            await recorder.time(bot_module.ticket_setup.callback(FakeInteraction(guild, guild.me, channel), channel))
+
+    return await run_scenario('ticket_setup', body)
+
+
+async def bench_panel_rehydrate(bot_module, panels, runs):
+    """Startup re-registration of stored ticket panels; should make no REST calls."""
+    conn = sqlite3.connect(os.environ['SQLITE_PATH'])
+    with conn:
+        conn.executemany('INSERT INTO ticket_panels (guild_id, channel_id, message_id, placeholder) VALUES (?, ?, ?, ?)',
+                         [(str(1000 + i % 50), str(2000 + i), str(3000000 + i), 'Pick one') for i in range(panels)])
+    conn.close()
+
+    async def body(recorder):
+        for _ in range(runs):
+            await recorder.time(bot_module.bot._load_ticket_panels())
+        if len(bot_module.ticket_panels) < panels:
+            recorder.errors += 1
+            print(f"  error: only {len(bot_module.ticket_panels)} of {panels} panels registered")
+
+    return await run_scenario(f'panel_rehydrate[{panels}]', body)
+
+
+async def main(args):
+    Rest.latency = args.latency / 1000
+    import bot as bot_module
+
+    bot = bot_module.bot
+    bot._connection.user = FakeUser('bench-bot', bot=True)
+    # Measure the handlers as they run in production, with instrumentation
+    bot_module.metrics.instrument_tree(bot.tree)
+    # Same warm-up the bot runs from setup_hook, minus the gateway
+    bot.warm_up_task = asyncio.create_task(bot._warm_up())
+    await bot.warm_up_task
+
+    results = {}
+    scale = args.scale
+    results['ticket_burst'] = await bench_ticket_burst(bot_module, users=200 * scale)
+    results['ticket_spam'] = await bench_ticket_spam(bot_module, users=50 * scale, clicks=3)
+    results['ticket_close'] = await bench_ticket_close(bot_module, tickets=20, messages=1000 * scale)
+    results['autoresponse_scan'] = await bench_autoresponse_scan(bot_module, triggers=5000 * scale, messages=1000 * scale)
+    results['mute_fanout'] = await bench_mute_fanout(bot_module, categories=10, channels_per_category=49, runs=3)
+    results['clear'] = await bench_clear(bot_module, messages=2000 * scale, runs=3)
+    results['kick'] = await bench_kick(bot_module, count=200 * scale)
+    results['ticket_setup'] = await bench_ticket_setup(bot_module, categories=20, runs=20)
+    results['panel_rehydrate'] = await bench_panel_rehydrate(bot_module, panels=1000 * scale, runs=5)
+
+    if args.metrics:
+        print(bot_module.metrics.render_metrics())
+    await bot_module.ledger.close()
+    await bot_module.db.close()
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'simulated_latency_ms': args.latency,
+            'scale': scale,
+        },
+        'scenarios': results,
+    }
+
+
+def compare(current, baseline_path, threshold):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = []
+    print(f"\nCompared with {baseline_path}:")
+    for name, result in current['scenarios'].items():
+        old = baseline.get('scenarios', {}).get(name)
+        if not old or not old['p99_ms']:
+            continue
+        change = (result['p99_ms'] - old['p99_ms']) / old['p99_ms']
+        print(f"{name:<24} p99 {old['p99_ms']:>9.3f}ms -> {result['p99_ms']:>9.3f}ms ({change:+.1%})")
+        if change > threshold:
+            regressions.append(name)
+    if regressions:
+        print(f"p99 regressed by more than {threshold:.0%} in: {', '.join(regressions)}")
+    return not regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', type=float, default=50, help='simulated REST latency in ms (default 50)')
+    parser.add_argument('--scale', type=int, default=1, help='multiply scenario sizes by this factor')
+    parser.add_argument('--metrics', action='store_true', help='print the Prometheus metrics collected during the run')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='compare p99 latencies with a previous results file')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed p99 regression for --compare (default 0.2)')
+    args = parser.parse_args()
+
+    results = asyncio.run(main(args))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare and not compare(results, args.compare, args.threshold):
+        sys.exit(1)
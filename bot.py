@@ -1,7 +1,13 @@
 import os
+import asyncio
+import datetime
+import logging
+import re
+import signal
+import time
 # print("os imported")
 
-print("Bot script started!")
+_process_started = time.perf_counter()
 import discord
 # print("discord imported")
 from discord.ext import commands
@@ -9,12 +15,21 @@ from discord.ext import commands
 from discord import app_commands
 # print("app_commands imported")
 from dotenv import load_dotenv
-import sqlitecloud
-import time
-import asyncio # Import asyncio for sleep
+from database import Database
+from tickets import OpenTicketIndex, TicketScheduler, TicketQueueFull, TicketInProgress
+from autoresponse import AutoResponder, MATCH_MODES, normalize
+from fanout import apply_overwrite
+from bans import BanIndex, user_label
+from purge import PurgeManager, PurgeFilters
+from command_sync import sync_if_changed
+from migrations import migrate
+from ledger import Ledger, COINS, TICKETS, check_path as check_ledger_path
+from transcripts import TicketCloser
+from panels import CategoryCache, PanelStore, MAX_SELECTS, panel_custom_id, parse_custom_id, paginate
+from cluster import shard_config_from_env, shard_stats
+import metrics
+import memory
 # print("dotenv imported")
-# print("sqlitecloud and time imported")
-# print("asyncio imported")
 
 # Last deployment: 2024-03-19
 
@@ -22,131 +37,262 @@ import asyncio # Import asyncio for sleep
 load_dotenv()
 # print(".env loaded")
 
+# Structured logs carrying guild/user/command (see metrics.py)
+metrics.setup_logging()
+log = logging.getLogger('bot')
+log.info("Bot script started!")
+
 # Debug environment variables
 # print("Checking environment variables...")
 # print(f"Current working directory: {os.getcwd()}") siu
 
-# Global database variables
-conn = None
-cursor = None
+# Shared async database handle (see database.py)
+db = Database()
+# Open tickets keyed by (guild_id, user_id); written through on insert/close (see tickets.py)
+ticket_index = OpenTicketIndex(db)
+# Paces ticket channel creation per guild, one request per user at a time (see tickets.py)
+ticket_scheduler = TicketScheduler()
+# Archives a ticket's history to a transcript, then closes and deletes it (see transcripts.py)
+ticket_closer = TicketCloser(ticket_index)
+# Posted ticket panels, re-registered as persistent views at startup (see panels.py)
+panel_categories = CategoryCache()
+ticket_panels = PanelStore(db, panel_categories)
+# Compiled per-guild auto-response matchers (see autoresponse.py)
+auto_responder = AutoResponder(db)
+# Banned users per guild, kept current by ban/unban events (see bans.py)
+ban_index = BanIndex()
+# Running /clear jobs, checkpointed to the purge_jobs table (see purge.py)
+purge_manager = PurgeManager(db)
+# Economy balances backed by an append-only local ledger (see ledger.py)
+ledger = Ledger()
+# Which shards this process runs; None when unsharded (see cluster.py)
+shard_config = shard_config_from_env()
+
 
-def initialize_database():
-    global conn, cursor
+def owns_guild(guild_id):
+    """Whether this process's shards serve the guild. Always True when unsharded."""
+    return shard_config is None or shard_config.owns_guild(guild_id)
+
+async def initialize_database():
+    """Connect to the database and bring the schema up to date (see migrations.py)."""
     try:
-        # Get database connection details from environment variables
-        api_key = os.getenv('SQLITECLOUD_API_KEY')
-        db_name = os.getenv('SQLITECLOUD_DB')
-        host = os.getenv('SQLITECLOUD_HOST')
-        port = os.getenv('SQLITECLOUD_PORT')
-
-        # Validate environment variables
-        if not api_key:
-            print("Error: SQLITECLOUD_API_KEY environment variable is not set")
-            return False
-        if not db_name:
-            print("Error: SQLITECLOUD_DB environment variable is not set")
-            return False
-        if not host:
-            print("Error: SQLITECLOUD_HOST environment variable is not set")
+        # After a failed migration the pool is still fine; don't tear it down to retry
+        if not db.connected and not await db.connect():
             return False
-        if not port:
-            print("Error: SQLITECLOUD_PORT environment variable is not set")
-            return False
-            
-        # Construct the connection string
-        connection_string = f"sqlitecloud://{host}:{port}/{db_name}?apikey={api_key}"
-        print(f"Attempting to connect to database...")
-        
-        if conn is not None:
-            try:
-                conn.close()
-            except Exception as close_err:
-                print(f"Error closing existing database connection: {close_err}")
-                pass
-        
-        # Add connection timeout and retry logic
-        max_retries = 3
-        retry_count = 0
-        while retry_count < max_retries:
-            try:
-                conn = sqlitecloud.connect(connection_string)
-                cursor = conn.cursor()
-                
-                # Test the connection with a simple query
-                cursor.execute('SELECT 1')
-                
-                # Note: Auto-response table creation is removed here.
-                
-                # Removed ticket categories table creation.
-                
-                # Removed ticket panels table creation.
-
-                # Create tickets table if it doesn't exist
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS tickets (
-                        ticket_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        guild_id TEXT,
-                        channel_id TEXT UNIQUE,
-                        user_id TEXT,
-                        category_name TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        status TEXT DEFAULT 'open'
-                    )
-                ''')
-                
-                conn.commit()
-                print("Successfully connected to the database!")
-                return True
-            except Exception as e:
-                retry_count += 1
-                print(f"Database connection attempt failed: {str(e)}")
-                if retry_count < max_retries:
-                    print(f"Retrying in 5 seconds... (Attempt {retry_count + 1} of {max_retries})")
-                    time.sleep(5)
-                else:
-                    print("Max retries reached. Could not connect to database.")
-                    return False
-                    
+        version = await migrate(db)
+        log.info(f"Database schema is at version {version}.")
+        return True
     except Exception as e:
-        print(f"Error initializing database: {str(e)}")
-        print("Please check your SQLiteCloud environment variables (API_KEY, DB, HOST, PORT)")
+        log.error(f"Error initializing database: {str(e)}")
         return False
 
-def ensure_db_connection():
-    global conn, cursor
-    try:
-        if conn is None or cursor is None:
-            return initialize_database()
-            
-        try:
-            # Test the connection with a simple query
-            cursor.execute('SELECT 1')
-            return True
-        except Exception:
-            # If the test fails, try to reinitialize
-            return initialize_database()
-            
-    except Exception as e:
-        print(f"Error in ensure_db_connection: {str(e)}")
-        return initialize_database()
+# Seconds between retries of a failed warm-up, so a persistent failure isn't retried on every command
+WARM_UP_RETRY_INTERVAL = 30
+
+async def ensure_db_connection():
+    # The pool health-checks idle connections in the background and reconnects
+    # when a query fails, so there is no per-request round trip here.
+    if bot.warm_up_task is None:
+        return False
+    if bot.warm_up_task.done() and not bot.warm_up_ok and time.monotonic() - bot.warm_up_finished >= WARM_UP_RETRY_INTERVAL:
+        # Warm-up failed: retry all of it (connect, migrate, reload tickets and
+        # panels) in one shared task, however many handlers are waiting on it
+        bot.warm_up_task = asyncio.create_task(bot._recover())
+    if not bot.warm_up_task.done():
+        await asyncio.shield(bot.warm_up_task)
+    return db.connected
 
 intents = discord.Intents.default()
 intents.members = True
 intents.message_content = True
 
-class Bot(commands.Bot):
+# SHARD_COUNT / SHARD_IDS switch to AutoShardedBot, one gateway connection per shard
+BotBase = commands.AutoShardedBot if shard_config is not None else commands.Bot
+
+class Bot(BotBase):
     def __init__(self):
-        super().__init__(command_prefix='-', intents=intents) # Prefix is not used for slash commands, but required for Bot class
-        
+        shard_kwargs = shard_config.bot_kwargs() if shard_config is not None else {}
+        super().__init__(command_prefix='-', intents=intents, **memory.client_options(intents), **shard_kwargs) # Prefix is not used for slash commands, but required for Bot class
+        self.startup_time = None
+        self.warm_up_task = None
+        self.warm_up_ok = False  # connected, migrated and caches loaded
+        self.warm_up_finished = float('-inf')
+        self._resume_task = None
+        self._sync_task = None
+        self._loop_lag_task = None
+        self._metrics_runner = None
+        self._close_task = None
+
     async def setup_hook(self):
-        await self.tree.sync()
-        print("Slash commands synced.") # Added confirmation print
-        
+        # The cluster launcher, Docker and Heroku all stop the bot with SIGTERM; close it
+        # properly so the ledger's queued commit is flushed and the metrics server stops
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, self._on_sigterm)
+        except NotImplementedError:
+            pass  # Windows
+
+        # Latency/error metrics for every command, served with the rest on /metrics
+        metrics.instrument_tree(self.tree)
+        metrics.track_shards(lambda: shard_stats(self))
+        memory.track_caches(self)
+        self._loop_lag_task = asyncio.create_task(metrics.monitor_loop_lag())
+        try:
+            self._metrics_runner = await metrics.start_server()
+        except Exception as e:
+            log.error(f"Error starting metrics endpoint: {e}")
+
+        # Database setup runs alongside the gateway login instead of before it
+        self.warm_up_task = asyncio.create_task(self._warm_up())
+        self._resume_task = asyncio.create_task(self._resume_jobs())
+
+        # The command tree is global, so one cluster worker syncing it is enough
+        if shard_config is None or shard_config.cluster_id == 0:
+            self._sync_task = asyncio.create_task(self._sync_commands())
+
+    async def _sync_commands(self):
+        # The last synced hash lives in the DB (see command_sync.py), so wait for warm-up
+        await asyncio.shield(self.warm_up_task)
+        # Only hits the rate-limited sync endpoint when the command tree changed
+        started = time.perf_counter()
+        try:
+            await sync_if_changed(self.tree, db if db.connected else None)
+        except Exception as e:
+            log.error(f"Error syncing slash commands: {e}")
+        log.info(f"Command sync check took {time.perf_counter() - started:.2f}s")
+
+    def _on_sigterm(self):
+        log.info("Received SIGTERM, shutting down...")
+        if self._close_task is None:
+            self._close_task = asyncio.create_task(self.close())
+
+    def warm_up_done(self):
+        return self.warm_up_task is not None and self.warm_up_task.done()
+
+    async def _warm_up(self, open_ledger=True):
+        """Connect the pool, migrate the schema and fill the caches.
+
+        Runs once per process, and again through ``ensure_db_connection`` if any step failed.
+        """
+        try:
+            self.warm_up_ok = await self._warm_up_steps(open_ledger)
+        finally:
+            self.warm_up_finished = time.monotonic()
+
+    async def _warm_up_steps(self, open_ledger):
+        """Returns True if every step succeeded."""
+        started = time.perf_counter()
+        if open_ledger:
+            db_ok, ledger_error = await asyncio.gather(initialize_database(), ledger.open(), return_exceptions=True)
+            if isinstance(ledger_error, Exception):
+                log.error(f"Error opening economy ledger: {ledger_error}")
+        else:
+            db_ok = await initialize_database()
+        if db_ok is not True:
+            log.error("Failed to set up the database. Database functionality will not work until a retry succeeds.")
+            return False
+        ok = True
+        try:
+            await ticket_index.load(owns_guild)
+        except Exception as e:
+            ok = False
+            log.error(f"Error loading open tickets: {e}")
+        try:
+            await self._load_ticket_panels()
+        except Exception as e:
+            ok = False
+            log.error(f"Error loading ticket panels: {e}")
+        log.info(f"Database warm-up took {time.perf_counter() - started:.2f}s")
+        return ok
+
+    async def _recover(self):
+        """Retry the database part of warm-up, then resume the purge jobs startup had to skip."""
+        await self._warm_up(open_ledger=False)
+        if self.warm_up_ok and self._resume_task is not None and self._resume_task.done() and self.is_ready():
+            try:
+                await purge_manager.resume(self, owns_guild)
+            except Exception as e:
+                log.error(f"Error resuming purge jobs: {e}")
+
+    async def _load_ticket_panels(self):
+        """Register every posted panel as a persistent view. Local only, no REST calls."""
+        for panel in await ticket_panels.load(owns_guild):
+            view = TicketPanel.for_routing(panel.panel_id)
+            panel.views = [view]
+            self.add_view(view, message_id=panel.message_id)
+
+    async def _resume_jobs(self):
+        # Purge jobs need the channel cache, which is only filled once we're ready
+        await asyncio.gather(self.warm_up_task, self.wait_until_ready())
+        if not self.warm_up_ok:
+            return  # _recover() resumes them once the database is usable
+        try:
+            await purge_manager.resume(self, owns_guild)
+        except Exception as e:
+            log.error(f"Error resuming purge jobs: {e}")
+
+    async def close(self):
+        try:
+            await ledger.close()
+        except Exception as e:
+            log.error(f"Error closing economy ledger: {e}")
+        if self._metrics_runner is not None:
+            await self._metrics_runner.cleanup()
+        await super().close()
+
     async def on_ready(self):
-        print(f'Logged in as {self.user}')
-        # Initialize database when bot starts
-        if not initialize_database():
-            print("Failed to connect to database on startup. Database functionality will not work.")
+        # Fires again on every reconnect, so keep this cheap
+        log.info(f'Logged in as {self.user}')
+        if self.startup_time is None:
+            self.startup_time = time.perf_counter() - _process_started
+            log.info(f"Startup to ready took {self.startup_time:.2f}s")
+
+    async def on_shard_ready(self, shard_id):
+        log.info(f"Shard {shard_id} ready")
+
+    async def on_guild_channel_create(self, channel):
+        if isinstance(channel, discord.CategoryChannel):
+            panel_categories.add(channel)
+
+    async def on_guild_channel_update(self, before, after):
+        if isinstance(after, discord.CategoryChannel):
+            panel_categories.update(before, after)
+
+    async def on_guild_channel_delete(self, channel):
+        if isinstance(channel, discord.CategoryChannel):
+            panel_categories.remove(channel)
+            return
+        # A ticket channel deleted by hand should not block the user from opening a new one
+        if ticket_index.is_ticket(channel.id) or not ticket_index.loaded:
+            try:
+                await ticket_index.close(channel.id)
+            except Exception as e:
+                log.error(f"Error closing ticket for deleted channel {channel.id}: {e}")
+        try:
+            await ticket_panels.forget_channel(channel.id)
+        except Exception as e:
+            log.error(f"Error removing ticket panels of deleted channel {channel.id}: {e}")
+
+    async def on_raw_message_delete(self, payload):
+        try:
+            await ticket_panels.forget_messages([payload.message_id])
+        except Exception as e:
+            log.error(f"Error removing deleted ticket panel {payload.message_id}: {e}")
+
+    async def on_raw_bulk_message_delete(self, payload):
+        try:
+            await ticket_panels.forget_messages(payload.message_ids)
+        except Exception as e:
+            log.error(f"Error removing deleted ticket panels: {e}")
+
+    async def on_member_ban(self, guild, user):
+        ban_index.add(guild.id, user)
+
+    async def on_member_unban(self, guild, user):
+        ban_index.remove(guild.id, user.id)
+
+    async def on_guild_remove(self, guild):
+        ban_index.forget_guild(guild.id)
+        panel_categories.forget_guild(guild.id)
 
 bot = Bot()
 
@@ -155,10 +301,88 @@ async def on_message(message):
     if message.author.bot:
         return
 
+    if message.guild and bot.warm_up_done() and db.connected and message.content:
+        try:
+            trigger = await auto_responder.match(message.guild.id, message.content)
+            if trigger:
+                await message.channel.send(trigger.response)
+        except Exception as e:
+            log.error(f"Error handling auto-response: {e}")
+
     # IMPORTANT: This line is crucial to allow other commands to work
     await bot.process_commands(message)
 
-# Removed auto-response commands (addresponse, removeresponse, listresponses)
+# --- Auto-Response Commands --- #
+
+@bot.tree.command(name="addresponse", description="Add an auto-response to this server")
+@app_commands.checks.has_permissions(manage_guild=True)
+@app_commands.describe(
+    trigger="The text that triggers the response",
+    response="What the bot replies with",
+    mode="exact: whole message, contains: anywhere, word: as a whole word",
+    cooldown="Seconds before this trigger can fire again (default 0)"
+)
+@app_commands.choices(mode=[app_commands.Choice(name=m, value=m) for m in MATCH_MODES])
+async def addresponse(interaction: discord.Interaction, trigger: str, response: str, mode: str = "contains", cooldown: int = 0):
+    """Add an auto-response to this server."""
+    if not normalize(trigger):
+        await interaction.response.send_message("The trigger can't be empty or only spaces.", ephemeral=True)
+        return
+    # Defer first: reconnecting to the database can take longer than the 3s interaction deadline
+    await interaction.response.defer(ephemeral=True)
+    if not await ensure_db_connection():
+        await interaction.followup.send("Database connection failed. Cannot save auto-responses at this time.", ephemeral=True)
+        return
+    try:
+        entry = await auto_responder.add(interaction.guild.id, trigger, response, mode=mode, cooldown=max(0, cooldown))
+        await interaction.followup.send(f"Auto-response added for `{entry.trigger}` ({entry.mode}).", ephemeral=True)
+    except Exception as e:
+        log.error(f"Error adding auto-response: {e}")
+        await interaction.followup.send(f"Failed to add auto-response. Error: {e}", ephemeral=True)
+
+@bot.tree.command(name="removeresponse", description="Remove an auto-response from this server")
+@app_commands.checks.has_permissions(manage_guild=True)
+async def removeresponse(interaction: discord.Interaction, trigger: str):
+    """Remove an auto-response from this server."""
+    await interaction.response.defer(ephemeral=True)
+    if not await ensure_db_connection():
+        await interaction.followup.send("Database connection failed. Cannot change auto-responses at this time.", ephemeral=True)
+        return
+    try:
+        if await auto_responder.remove(interaction.guild.id, trigger):
+            await interaction.followup.send(f"Auto-response for `{trigger}` removed.", ephemeral=True)
+        else:
+            await interaction.followup.send(f"No auto-response found for `{trigger}`.", ephemeral=True)
+    except Exception as e:
+        log.error(f"Error removing auto-response: {e}")
+        await interaction.followup.send(f"Failed to remove auto-response. Error: {e}", ephemeral=True)
+
+@bot.tree.command(name="listresponses", description="List all auto-responses in this server")
+@app_commands.checks.has_permissions(manage_guild=True)
+async def listresponses(interaction: discord.Interaction):
+    """List all auto-responses in this server."""
+    await interaction.response.defer(ephemeral=True)
+    if not await ensure_db_connection():
+        await interaction.followup.send("Database connection failed. Cannot load auto-responses at this time.", ephemeral=True)
+        return
+    triggers = await auto_responder.list(interaction.guild.id)
+    if not triggers:
+        await interaction.followup.send("No auto-responses set up in this server.", ephemeral=True)
+        return
+
+    # Keep the reply under Discord's 2000 character message limit
+    lines = []
+    length = 0
+    for entry in triggers:
+        line = f"`{entry.trigger}` ({entry.mode}) -> {entry.response}"
+        if len(line) > 200:
+            line = line[:197] + '...'
+        if length + len(line) + 1 > 1900:
+            lines.append(f"...and {len(triggers) - len(lines)} more")
+            break
+        lines.append(line)
+        length += len(line) + 1
+    await interaction.followup.send("\n".join(lines), ephemeral=True)
 
 # Add moderation commands (keeping these as they are not related to auto-responses)
 @bot.tree.command(name="kick", description="Kick a member from the server")
@@ -175,65 +399,247 @@ async def ban(interaction: discord.Interaction, member: discord.Member, reason:
     await member.ban(reason=reason)
     await interaction.response.send_message(f'{member.mention} تم حظره بنجاح!')
 
-@bot.tree.command(name="unban", description="Unban a user by name#discriminator")
+@bot.tree.command(name="unban", description="Unban a user by ID, username or name#discriminator")
 @app_commands.checks.has_permissions(ban_members=True)
+@app_commands.describe(user="User ID, username or legacy name#discriminator")
 async def unban(interaction: discord.Interaction, user: str):
-    """Unban a user by name#discriminator."""
-    banned_users = await interaction.guild.bans()
-    name, discriminator = user.split('#')
-    for ban_entry in banned_users:
-        if (ban_entry.user.name, ban_entry.user.discriminator) == (name, discriminator):
-            await interaction.guild.unban(ban_entry.user)
-            await interaction.response.send_message(f'{ban_entry.user.mention} تم فك الحظر عنه!')
-            return
-    await interaction.response.send_message('المستخدم غير موجود في قائمة المحظورين.')
+    """Unban a user by ID, username or name#discriminator."""
+    # Reading the ban list can take a few REST pages in big guilds
+    await interaction.response.defer()
+    banned_user = await ban_index.find(interaction.guild, user)
+    if banned_user is None:
+        await interaction.followup.send('المستخدم غير موجود في قائمة المحظورين.')
+        return
+    try:
+        await interaction.guild.unban(banned_user)
+    except discord.NotFound:
+        # Stale index entry, e.g. an unban event missed while reconnecting
+        ban_index.remove(interaction.guild.id, banned_user.id)
+        await interaction.followup.send('المستخدم غير موجود في قائمة المحظورين.')
+        return
+    ban_index.remove(interaction.guild.id, banned_user.id)
+    await interaction.followup.send(f'{banned_user.mention} تم فك الحظر عنه!')
+
+@unban.autocomplete('user')
+async def unban_autocomplete(interaction: discord.Interaction, current: str):
+    ban_index.ensure_loaded(interaction.guild)
+    return [
+        app_commands.Choice(name=f"{user_label(banned)} ({banned.id})"[:100], value=str(banned.id))
+        for banned in ban_index.autocomplete(interaction.guild.id, current)
+    ]
+
+MUTED_OVERWRITE = discord.PermissionOverwrite(speak=False, send_messages=False, read_message_history=True, read_messages=True)
+
+# guild_id -> running Muted role setup, so concurrent /mute calls share one fan-out
+_mute_setups = {}
+
+async def _setup_muted_role(guild, role, on_progress):
+    """Apply the Muted overwrite to every channel that doesn't have it yet."""
+    done, failed, total = await apply_overwrite(guild, role, MUTED_OVERWRITE, reason="Muted role setup", on_progress=on_progress)
+    for channel, error in failed:
+        log.error(f"Error setting Muted permissions in {channel} ({guild.id}): {error}")
+    if not failed and db.connected:
+        await db.execute("UPDATE mute_setups SET completed = 1 WHERE guild_id = ?", (str(guild.id),))
+    return done, failed, total
 
-@bot.tree.command(name="mute", description="Mute a member by adding a Muted role")
+async def _muted_role_needs_setup(guild, role):
+    if not db.connected:
+        return False
+    row = await db.fetchone("SELECT role_id, completed FROM mute_setups WHERE guild_id = ?", (str(guild.id),))
+    return row is not None and row[0] == str(role.id) and not row[1]
+
+@bot.tree.command(name="mute", description="Mute a member by adding a Muted role, or time them out for a number of minutes")
 @app_commands.checks.has_permissions(manage_roles=True)
-async def mute(interaction: discord.Interaction, member: discord.Member):
-    """Mute a member by adding a Muted role."""
-    muted_role = discord.utils.get(interaction.guild.roles, name="Muted")
+@app_commands.describe(duration="Minutes to time the member out for (uses Discord's timeout instead of the Muted role)")
+async def mute(interaction: discord.Interaction, member: discord.Member, duration: app_commands.Range[int, 1, 40320] = None):
+    """Mute a member by adding a Muted role, or with a native timeout when a duration is given."""
+    if duration:
+        # Manage Roles alone must not grant timeouts
+        if not interaction.permissions.moderate_members:
+            await interaction.response.send_message('تحتاج صلاحية Timeout Members لإعطاء ميوت مؤقت.', ephemeral=True)
+            return
+        # Native timeout needs no role and no per-channel overwrites
+        await member.timeout(datetime.timedelta(minutes=duration))
+        await interaction.response.send_message(f'{member.mention} تم إعطاؤه ميوت لمدة {duration} دقيقة!')
+        return
+
+    # The role setup below can take a while in big guilds
+    await interaction.response.defer()
+    guild = interaction.guild
+
+    muted_role = discord.utils.get(guild.roles, name="Muted")
+    needs_setup = False
     if not muted_role:
-        muted_role = await interaction.guild.create_role(name="Muted")
-        for channel in interaction.guild.channels:
-            await channel.set_permissions(muted_role, speak=False, send_messages=False, read_message_history=True, read_messages=True)
+        muted_role = await guild.create_role(name="Muted")
+        if db.connected:
+            await db.execute("INSERT OR REPLACE INTO mute_setups (guild_id, role_id, completed) VALUES (?, ?, 0)",
+                             (str(guild.id), str(muted_role.id)))
+        needs_setup = True
+    elif guild.id in _mute_setups or await _muted_role_needs_setup(guild, muted_role):
+        needs_setup = True
+
+    if needs_setup:
+        async def report(done, failed, total):
+            await interaction.edit_original_response(content=f'جاري إعداد رتبة الميوت: {done + len(failed)}/{total} قناة...')
+
+        setup = _mute_setups.get(guild.id)
+        if setup is None:
+            setup = asyncio.create_task(_setup_muted_role(guild, muted_role, report))
+            _mute_setups[guild.id] = setup
+            setup.add_done_callback(lambda _: _mute_setups.pop(guild.id, None))
+        try:
+            await asyncio.shield(setup)
+        except Exception as e:
+            log.error(f"Error setting up Muted role: {e}")
+
     await member.add_roles(muted_role)
-    await interaction.response.send_message(f'{member.mention} تم إعطاؤه ميوت!')
+    await interaction.edit_original_response(content=f'{member.mention} تم إعطاؤه ميوت!')
 
 @bot.tree.command(name="unmute", description="Unmute a member by removing the Muted role")
 @app_commands.checks.has_permissions(manage_roles=True)
 async def unmute(interaction: discord.Interaction, member: discord.Member):
     """Unmute a member by removing the Muted role."""
     muted_role = discord.utils.get(interaction.guild.roles, name="Muted")
-    if muted_role in member.roles:
+    if member.is_timed_out():
+        # Lifting a timeout needs Timeout Members, not just Manage Roles
+        if not interaction.permissions.moderate_members:
+            await interaction.response.send_message('تحتاج صلاحية Timeout Members لفك الميوت المؤقت.', ephemeral=True)
+            return
+        await member.timeout(None)
+        if muted_role in member.roles:
+            await member.remove_roles(muted_role)
+        await interaction.response.send_message(f'{member.mention} تم فك الميوت عنه!')
+    elif muted_role in member.roles:
         await member.remove_roles(muted_role)
         await interaction.response.send_message(f'{member.mention} تم فك الميوت عنه!')
     else:
         await interaction.response.send_message('المستخدم ليس عليه ميوت.')
 
+# A raw message ID, or a message link (https://discord.com/channels/<guild>/<channel>/<message>)
+_MESSAGE_ID_RE = re.compile(r'(?:https?://(?:\w+\.)?discord(?:app)?\.com/channels/(?:\d+|@me)/\d+/)?(\d+)')
+
+def _parse_message_id(value):
+    """The message ID in ``value``. Raises ValueError if it is neither an ID nor a message link."""
+    if value is None:
+        return None
+    match = _MESSAGE_ID_RE.fullmatch(value.strip())
+    if match is None:
+        raise ValueError(value)
+    return int(match.group(1))
+
 @bot.tree.command(name="clear", description="Clear a number of messages")
 @app_commands.checks.has_permissions(manage_messages=True)
-async def clear(interaction: discord.Interaction, amount: int = 5):
+@app_commands.describe(
+    amount="How many messages to delete (default 5)",
+    user="Only delete messages from this user",
+    contains="Only delete messages containing this text",
+    bots_only="Only delete messages sent by bots",
+    before="Only delete messages before this message (ID or link)",
+    after="Only delete messages after this message (ID or link)"
+)
+async def clear(
+    interaction: discord.Interaction,
+    amount: app_commands.Range[int, 1, 100000] = 5,
+    user: discord.User = None,
+    contains: str = None,
+    bots_only: bool = False,
+    before: str = None,
+    after: str = None
+):
     """Clear a number of messages (default 5)."""
     # Defer the interaction to prevent timeout
     await interaction.response.defer(ephemeral=True)
 
     try:
-        # Purge messages
-        deleted = await interaction.channel.purge(limit=amount + 1)
-        # Send a follow-up message after the purge is complete
-        await interaction.followup.send(f'تم حذف {len(deleted) - 1} رسالة!', ephemeral=True)
+        before_id = _parse_message_id(before)
+        after_id = _parse_message_id(after)
+    except ValueError as e:
+        # Dropping a bad filter would delete the newest messages instead
+        await interaction.followup.send(f"معرف أو رابط الرسالة غير صالح: {e}", ephemeral=True)
+        return
+
+    # Reserved before any await, so two /clear calls in one channel can't both start a job
+    channel_id = interaction.channel.id
+    if not purge_manager.reserve(channel_id):
+        await interaction.followup.send("هناك عملية حذف جارية في هذه القناة. استخدم /clear-cancel لإيقافها.", ephemeral=True)
+        return
+    try:
+        if not await ensure_db_connection():
+            await interaction.followup.send("حدث خطأ أثناء حذف الرسائل.", ephemeral=True)
+            return
+
+        filters = PurgeFilters(
+            author_id=user.id if user else None,
+            contains=contains,
+            bots_only=bots_only,
+            before=before_id,
+            after=after_id
+        )
+
+        progress_message = await interaction.followup.send(f'جاري الحذف... 0/{amount}', ephemeral=True, wait=True)
+
+        async def report(job, final):
+            if final:
+                await progress_message.edit(content=f'تم حذف {job.deleted} رسالة!')
+            else:
+                await progress_message.edit(content=f'جاري الحذف... {job.deleted}/{job.max_messages}')
+
+        await purge_manager.start(interaction.channel, interaction.user.id, amount, filters, on_progress=report)
     except Exception as e:
-        print(f"Error clearing messages: {e}")
+        log.error(f"Error clearing messages: {e}")
         try:
             await interaction.followup.send("حدث خطأ أثناء حذف الرسائل.", ephemeral=True)
         except:
             pass # Ignore if sending error message fails
+    finally:
+        # No-op once the job has launched
+        purge_manager.release(channel_id)
+
+@bot.tree.command(name="clear-cancel", description="Stop the running message clear in this channel")
+@app_commands.checks.has_permissions(manage_messages=True)
+async def clear_cancel(interaction: discord.Interaction):
+    """Stop the running message clear in this channel."""
+    job = await purge_manager.cancel(interaction.channel.id)
+    if job is None:
+        await interaction.response.send_message("لا توجد عملية حذف جارية في هذه القناة.", ephemeral=True)
+    else:
+        await interaction.response.send_message(f'تم إيقاف الحذف بعد حذف {job.deleted} رسالة.', ephemeral=True)
+
+# --- Economy --- #
+
+@bot.tree.command(name="balance", description="Show a member's coins and tickets")
+async def balance(interaction: discord.Interaction, member: discord.Member = None):
+    """Show a member's coins and tickets."""
+    member = member or interaction.user
+    await interaction.response.send_message(
+        f"{member.mention}: {ledger.balance(member.id, COINS)} coins, {ledger.balance(member.id, TICKETS)} tickets",
+        ephemeral=True
+    )
+
+# --- Status --- #
+
+@bot.tree.command(name="shards", description="Show the latency and guild count of this worker's shards")
+async def shards(interaction: discord.Interaction):
+    """Show the latency and guild count of each shard run by this process."""
+    lines = []
+    for shard_id, (latency, guilds) in sorted(shard_stats(bot).items()):
+        latency_text = f"{latency * 1000:.0f} ms" if latency != float('inf') else "connecting"
+        marker = " (this server)" if interaction.guild and interaction.guild.shard_id == shard_id else ""
+        lines.append(f"Shard {shard_id}: {latency_text}, {guilds} servers{marker}")
+    total = shard_config.shard_count if shard_config is not None and shard_config.shard_count else bot.shard_count
+    header = f"Cluster {shard_config.cluster_id}, {total} shards total" if shard_config is not None else "Unsharded"
+    await interaction.response.send_message(header + "\n" + "\n".join(lines), ephemeral=True)
+
+@bot.tree.command(name="memory", description="Show how much the bot is caching")
+@app_commands.checks.has_permissions(manage_guild=True)
+async def memory_report(interaction: discord.Interaction):
+    """Show cache sizes for this worker and this server."""
+    await interaction.response.send_message(memory.memory_report(bot, interaction.guild), ephemeral=True)
 
 # --- Ticket System --- #
 
 class TicketCategorySelect(discord.ui.Select):
-    def __init__(self, categories: list[discord.CategoryChannel], placeholder: str = "Choose a ticket category...", custom_labels: dict = None):
+    def __init__(self, categories: list[discord.CategoryChannel], placeholder: str = "Choose a ticket category...", custom_labels: dict = None, custom_id: str = None):
         options = []
         for category in categories:
             # Determine the label to display for the category
@@ -256,13 +662,38 @@ class TicketCategorySelect(discord.ui.Select):
         if placeholder and len(placeholder) > 150:
             placeholder = placeholder[:147] + '...'
 
+        # A stable custom_id (see panels.py) is what lets the panel survive restarts
+        extra = {'custom_id': custom_id} if custom_id else {}
         super().__init__(
             placeholder=placeholder if placeholder else "Choose a ticket category...", # Use default if placeholder is empty string
             min_values=1,
             max_values=1,
-            options=options
+            options=options,
+            **extra
         )
 
+    async def _refresh_panel(self, interaction: discord.Interaction):
+        """Re-render the panel if the guild's categories changed since it was posted."""
+        parsed = parse_custom_id(self.custom_id)
+        panel = ticket_panels.get(parsed[0]) if parsed else None
+        if panel is None or interaction.message is None or not ticket_panels.is_stale(panel):
+            return
+        version = panel_categories.version(panel.guild_id)
+        view = TicketPanel(ticket_panels.options(interaction.guild, panel), placeholder=panel.placeholder,
+                           custom_labels=panel.custom_labels, panel_id=panel.panel_id)
+        if not view.children:
+            return  # Every category it offered is gone; leave the old options up
+        # Set before the edit so concurrent clicks don't all re-render it
+        panel.rendered_version = version
+        try:
+            # Editing with the new view also re-registers it for this message
+            await interaction.message.edit(view=view)
+            panel.views[1:] = [view]
+        except Exception as e:
+            panel.rendered_version = None
+            log.error(f"Error refreshing ticket panel {panel.panel_id}: {e}")
+
+    @metrics.timed_component('ticket_select')
     async def callback(self, interaction: discord.Interaction):
         # Defer the interaction immediately to prevent timeouts
         await interaction.response.defer(ephemeral=True)
@@ -275,66 +706,143 @@ class TicketCategorySelect(discord.ui.Select):
             await interaction.followup.send("This command can only be used in a server.", ephemeral=True)
             return
 
-        # Check if the user already has an open ticket
-        if ensure_db_connection():
-            try:
-                cursor.execute("SELECT channel_id FROM tickets WHERE guild_id = ? AND user_id = ? AND status = 'open'", (str(guild.id), str(user.id)))
-                existing_ticket = cursor.fetchone()
-                if existing_ticket:
-                    await interaction.followup.send(f"You already have an open ticket in <#{existing_ticket[0]}>.", ephemeral=True)
-                    return
-
-                # Get the selected category channel object
-                selected_category = guild.get_channel(category_id)
-
-                if not isinstance(selected_category, discord.CategoryChannel):
-                     await interaction.followup.send("Invalid category selected.", ephemeral=True)
-                     return
-
-                # Create the ticket channel within the selected category
-                overwrites = {
-                    guild.default_role: discord.PermissionOverwrite(view_channel=False),
-                    user: discord.PermissionOverwrite(view_channel=True, send_messages=True),
-                    guild.me: discord.PermissionOverwrite(view_channel=True, send_messages=True, manage_channels=True, manage_permissions=True, manage_roles=True)
-                    # Add staff roles here with view_channel=True
-                }
-
-                try:
-                    ticket_channel = await guild.create_text_channel(
-                        f'ticket-{user.name}',
-                        category=selected_category,  # Create the ticket in the selected category
-                        overwrites=overwrites
-                    )
-
-                    # Store ticket information in the database
-                    cursor.execute('INSERT INTO tickets (guild_id, channel_id, user_id, category_name) VALUES (?, ?, ?, ?)',
-                                  (str(guild.id), str(ticket_channel.id), str(user.id), selected_category.name))
-                    conn.commit()
-
-                    # Send initial message in the ticket channel
-                    embed = discord.Embed(
-                        title=f"New Ticket in {selected_category.name}",
-                        description=f"User: {user.mention}\nCategory: {selected_category.mention}", # Changed to mention the category
-                        color=discord.Color.blue()
-                    )
-                    await ticket_channel.send(embed=embed)
-
-                    await interaction.followup.send(f"Your ticket has been created: {ticket_channel.mention}", ephemeral=True)
-
-                except Exception as e:
-                    print(f"Error creating ticket channel: {e}")
-                    await interaction.followup.send(f"Error creating ticket channel: {e}", ephemeral=True)
-                    
-            except Exception as db_err:
-                 print(f"Database error during ticket creation: {db_err}")
-                 await interaction.followup.send(f"Database error during ticket creation. Please try again later. Error: {db_err}", ephemeral=True)
-        else:
+        await self._refresh_panel(interaction)
+
+        if not await ensure_db_connection():
             await interaction.followup.send("Database connection failed. Cannot create ticket at this time.", ephemeral=True)
+            return
+
+        # Get the selected category channel object
+        selected_category = guild.get_channel(category_id)
+        if not isinstance(selected_category, discord.CategoryChannel):
+            await interaction.followup.send("Invalid category selected.", ephemeral=True)
+            return
+
+        try:
+            # Fast path: the in-memory index answers repeat clicks without a DB round trip
+            existing_ticket = await ticket_index.find_open(guild.id, user.id)
+        except Exception as db_err:
+            log.error(f"Database error during ticket creation: {db_err}")
+            await interaction.followup.send(f"Database error during ticket creation. Please try again later. Error: {db_err}", ephemeral=True)
+            return
+        if existing_ticket:
+            await interaction.followup.send(f"You already have an open ticket in <#{existing_ticket}>.", ephemeral=True)
+            return
+
+        queue_message = None
+
+        async def report_position(position):
+            nonlocal queue_message
+            queue_message = await interaction.followup.send(
+                f"Lots of tickets are being opened right now. You're number {position} in the queue, hang tight...",
+                ephemeral=True, wait=True)
+
+        async def reply(content):
+            if queue_message is not None:
+                await queue_message.edit(content=content)
+            else:
+                await interaction.followup.send(content, ephemeral=True)
+
+        try:
+            ticket_channel, existing_ticket = await ticket_scheduler.submit(
+                guild.id, user.id, lambda: create_ticket_channel(guild, user, selected_category), on_queued=report_position)
+        except TicketInProgress:
+            await interaction.followup.send("Your ticket is already being created.", ephemeral=True)
+            return
+        except TicketQueueFull:
+            await interaction.followup.send("Too many tickets are being opened right now. Please try again in a minute.", ephemeral=True)
+            return
+        except Exception as e:
+            log.error(f"Error creating ticket channel: {e}")
+            await reply(f"Error creating ticket channel: {e}")
+            return
+
+        if ticket_channel is None:
+            if existing_ticket:
+                await reply(f"You already have an open ticket in <#{existing_ticket}>.")
+            else:
+                await reply("Your ticket is already being created.")
+            return
+
+        try:
+            # Send initial message in the ticket channel
+            embed = discord.Embed(
+                title=f"New Ticket in {selected_category.name}",
+                description=f"User: {user.mention}\nCategory: {selected_category.mention}", # Changed to mention the category
+                color=discord.Color.blue()
+            )
+            await ticket_channel.send(embed=embed)
+        except Exception as e:
+            log.error(f"Error sending ticket welcome message: {e}")
+
+        await reply(f"Your ticket has been created: {ticket_channel.mention}")
+
+
+async def create_ticket_channel(guild, user, category):
+    """Claim the user's ticket, then create its channel. Runs inside the guild's ticket queue.
+
+    Returns ``(channel, None)``, or ``(None, existing_channel_id)`` if the claim
+    lost to an open ticket (possibly one another worker is still creating).
+    """
+    ticket_id, existing_ticket = await ticket_index.claim(guild.id, user.id, category.name)
+    if ticket_id is None:
+        return None, existing_ticket
+
+    # Create the ticket channel within the selected category
+    overwrites = {
+        guild.default_role: discord.PermissionOverwrite(view_channel=False),
+        user: discord.PermissionOverwrite(view_channel=True, send_messages=True),
+        guild.me: discord.PermissionOverwrite(view_channel=True, send_messages=True, manage_channels=True, manage_permissions=True, manage_roles=True)
+        # Add staff roles here with view_channel=True
+    }
+    try:
+        ticket_channel = await guild.create_text_channel(
+            f'ticket-{user.name}',
+            category=category,  # Create the ticket in the selected category
+            overwrites=overwrites
+        )
+    except BaseException:
+        await _abandon_ticket(ticket_id)
+        raise
+
+    try:
+        await ticket_index.attach(ticket_id, guild.id, user.id, ticket_channel.id)
+    except BaseException:
+        # Don't leave a channel behind that no ticket row points to
+        await _abandon_ticket(ticket_id, ticket_channel)
+        raise
+    return ticket_channel, None
+
+
+async def _abandon_ticket(ticket_id, channel=None):
+    """Best-effort cleanup after a failed creation, so the user can try again."""
+    try:
+        if channel is not None:
+            await asyncio.shield(channel.delete(reason="Could not record ticket"))
+        await asyncio.shield(ticket_index.release(ticket_id))
+    except Exception as e:
+        log.error(f"Error cleaning up failed ticket {ticket_id}: {e}")
+
 
 class TicketPanel(discord.ui.View):
-    def __init__(self, categories: list[discord.CategoryChannel], placeholder: str = "Choose a ticket category...", custom_labels: dict = None):
+    def __init__(self, categories: list[discord.CategoryChannel], placeholder: str = "Choose a ticket category...", custom_labels: dict = None,
+                 panel_id: int = None, pages: int = None):
         super().__init__(timeout=None)
-        self.add_item(TicketCategorySelect(categories, placeholder=placeholder, custom_labels=custom_labels))
+        # 25 options per select, so big guilds get one select per page of categories
+        category_pages, self.dropped = paginate(list(categories))
+        if pages is not None:
+            category_pages = [[] for _ in range(pages)]
+        for page, page_categories in enumerate(category_pages):
+            page_placeholder = placeholder
+            if len(category_pages) > 1:
+                page_placeholder = f"{placeholder or 'Choose a ticket category...'} ({page + 1}/{len(category_pages)})"
+            self.add_item(TicketCategorySelect(page_categories, placeholder=page_placeholder, custom_labels=custom_labels,
+                                               custom_id=panel_custom_id(panel_id, page) if panel_id is not None else None))
+
+    @classmethod
+    def for_routing(cls, panel_id: int):
+        """A view for an already posted panel: just the custom IDs, to route clicks to the callback."""
+        return cls([], panel_id=panel_id, pages=MAX_SELECTS)
 
 # Removed commands for managing ticket categories
 # @bot.tree.command(name="addticketcategory", ...)
@@ -373,27 +881,32 @@ async def ticket_setup(
         await interaction.response.send_message("This command can only be used in a server.", ephemeral=True)
         return
 
+    await interaction.response.defer(ephemeral=True)
+    if not await ensure_db_connection():
+        await interaction.followup.send("Database connection failed. Cannot set up the ticket panel at this time.", ephemeral=True)
+        return
+
     try:
-        # Get all available category channels in the guild
-        all_categories = [c for c in guild.channels if isinstance(c, discord.CategoryChannel)]
+        # Get all available category channels in the guild (cached, see panels.py)
+        all_categories = panel_categories.categories(guild)
         
         if not all_categories:
-            await interaction.response.send_message("No categories found in this server. Please create at least one category first.", ephemeral=True)
+            await interaction.followup.send("No categories found in this server. Please create at least one category first.", ephemeral=True)
             return
 
         # Determine which categories to show in the panel dropdown
         categories_to_show = all_categories
         if category_filter:
             # If a filter category is selected, only show that one category in the dropdown
-            if category_filter in all_categories:
+            if panel_categories.get(guild, category_filter.id) is not None:
                  categories_to_show = [category_filter]
             else:
-                 await interaction.response.send_message(f"The selected category filter \"{category_filter.name}\" was not found in the server.", ephemeral=True)
+                 await interaction.followup.send(f"The selected category filter \"{category_filter.name}\" was not found in the server.", ephemeral=True)
                  return
                  
         # Ensure there is at least one category to show before creating the view
         if not categories_to_show:
-             await interaction.response.send_message("Could not determine categories to show in the panel.", ephemeral=True)
+             await interaction.followup.send("Could not determine categories to show in the panel.", ephemeral=True)
              return
 
         # Parse custom category labels
@@ -407,7 +920,7 @@ async def ticket_setup(
                         custom_labels[name.strip()] = label.strip()
                     # Ignore pairs without '->' to allow flexibility
             except Exception as e:
-                print(f"Error parsing custom category labels: {e}")
+                log.error(f"Error parsing custom category labels: {e}")
                 await interaction.followup.send("Warning: Could not parse custom category labels. Using default names.", ephemeral=True)
 
         # Create the embed
@@ -420,26 +933,104 @@ async def ticket_setup(
         if include_server_icon and guild.icon:
             embed.set_thumbnail(url=guild.icon.url)
 
+        # Store the panel first: its ID goes into the select custom IDs so it survives restarts
+        placeholder = placeholder_text if placeholder_text is not None else "Choose a ticket category..."
+        panel = await ticket_panels.create(guild.id, channel.id, category_filter.id if category_filter else None,
+                                           custom_labels, placeholder)
         # Create the view with the select menu using the determined categories, custom placeholder, and custom labels
-        view = TicketPanel(categories_to_show, placeholder=placeholder_text if placeholder_text is not None else "Choose a ticket category...", custom_labels=custom_labels)
+        version = panel_categories.version(guild.id)
+        view = TicketPanel(categories_to_show, placeholder=placeholder, custom_labels=custom_labels, panel_id=panel.panel_id)
 
         # Send the message
-        sent_message = await channel.send(embed=embed, view=view)
+        try:
+            sent_message = await channel.send(embed=embed, view=view)
+        except BaseException:
+            await asyncio.shield(ticket_panels.delete(panel))
+            raise
+        panel.views = [view]
+        panel.rendered_version = version
+        await ticket_panels.attach(panel, sent_message.id)
+        if view.dropped:
+            await interaction.followup.send(
+                f"Ticket panel sent to {channel.mention}, but only the first {len(categories_to_show) - view.dropped} of "
+                f"{len(categories_to_show)} categories fit in it.", ephemeral=True)
+            return
 
         if category_filter:
-             await interaction.response.send_message(f"Ticket panel sent to {channel.mention}. Only the {category_filter.name} category is available for selection.", ephemeral=True)
+             await interaction.followup.send(f"Ticket panel sent to {channel.mention}. Only the {category_filter.name} category is available for selection.", ephemeral=True)
         else:
-             await interaction.response.send_message(f"Ticket panel sent to {channel.mention}. All categories are available for selection.", ephemeral=True)
+             await interaction.followup.send(f"Ticket panel sent to {channel.mention}. All categories are available for selection.", ephemeral=True)
 
     except Exception as e:
-        print(f"Error sending ticket panel: {e}")
+        log.error(f"Error sending ticket panel: {e}")
         await interaction.followup.send(f"Failed to send ticket panel. Error: {e}", ephemeral=True)
 
-# You might want commands to close/manage tickets later, e.g.:
-# @bot.tree.command(name="closeticket", description="Close the current ticket")
-# @app_commands.checks.has_permissions(manage_channels=True)
-# async def closeticket(interaction: discord.Interaction):
-#     """Close the current ticket."""
-#     pass # Implementation needed
+@bot.tree.command(name="closeticket", description="Close the current ticket and save a transcript")
+@app_commands.describe(reason="Why the ticket is being closed")
+async def closeticket(interaction: discord.Interaction, reason: str = None):
+    """Close the current ticket. Staff with Manage Channels and the ticket's owner can close it."""
+    channel = interaction.channel
+    await interaction.response.defer(ephemeral=True)
+    if not await ensure_db_connection():
+        await interaction.followup.send("Database connection failed. Cannot close the ticket at this time.", ephemeral=True)
+        return
+    if not ticket_index.is_ticket(channel.id):
+        await interaction.followup.send("This channel is not an open ticket.", ephemeral=True)
+        return
+    if not (interaction.user.guild_permissions.manage_channels or ticket_index.owner(channel.id) == str(interaction.user.id)):
+        await interaction.followup.send("Only staff or the ticket's owner can close it.", ephemeral=True)
+        return
+
+    await channel.send("Saving the transcript and closing this ticket...")
+    try:
+        result = await ticket_closer.close(channel, closed_by=interaction.user, reason=reason)
+        if result is None:
+            await interaction.followup.send("This ticket is already being closed.", ephemeral=True)
+    except Exception as e:
+        log.error(f"Error closing ticket {channel.id}: {e}")
+        await interaction.followup.send(f"Error closing ticket: {e}", ephemeral=True)
+
+# One bulk close per guild at a time
+_inactive_closes = {}
+
+@bot.tree.command(name="close-inactive", description="Close every ticket with no messages for a number of days")
+@app_commands.checks.has_permissions(manage_channels=True)
+@app_commands.describe(days="Close tickets with no messages for at least this many days")
+async def close_inactive(interaction: discord.Interaction, days: app_commands.Range[int, 1, 365]):
+    """Close inactive tickets in the background, a few at a time."""
+    guild = interaction.guild
+    await interaction.response.defer(ephemeral=True)
+    if not await ensure_db_connection():
+        await interaction.followup.send("Database connection failed. Cannot close tickets at this time.", ephemeral=True)
+        return
+    if guild.id in _inactive_closes:
+        await interaction.followup.send("Inactive tickets are already being closed in this server.", ephemeral=True)
+        return
+
+    await interaction.edit_original_response(content=f"Looking for tickets inactive for {days} days...")
+
+    async def report(done, failed, total):
+        await interaction.edit_original_response(content=f"Closing inactive tickets: {done + len(failed)}/{total}...")
+
+    async def run():
+        try:
+            done, failed, total = await ticket_closer.close_inactive(guild, days, closed_by=interaction.user, on_progress=report)
+            summary = f"Closed {done} of {total} inactive tickets."
+            if failed:
+                summary += f" {len(failed)} could not be closed, see the logs."
+        except Exception as e:
+            log.error(f"Error closing inactive tickets: {e}")
+            summary = f"Error closing inactive tickets: {e}"
+        try:
+            await interaction.edit_original_response(content=summary)
+        except discord.HTTPException:
+            pass  # The interaction token expires after 15 minutes
+
+    job = asyncio.create_task(run())
+    _inactive_closes[guild.id] = job
+    job.add_done_callback(lambda _: _inactive_closes.pop(guild.id, None))
 
-bot.run(os.getenv('DISCORD_TOKEN')) 
\ No newline at end of file
+if __name__ == '__main__':
+    # Logging is already set up by metrics.setup_logging()
+    check_ledger_path()
+    bot.run(os.getenv('DISCORD_TOKEN'), log_handler=None) 
\ No newline at end of file
@@ -0,0 +1,238 @@
+"""Sharding settings and the multi-process cluster launcher.
+
+Environment variables:
+
+- ``SHARD_COUNT``: total number of shards, or ``auto`` to use Discord's
+  recommendation. Setting it (or ``SHARD_IDS``) runs the bot as an
+  ``AutoShardedBot``.
+- ``SHARD_IDS``: the shards this process runs, e.g. ``0-3`` or ``0,2,4``
+  (default: all of them)
+- ``CLUSTER_COUNT``: how many worker processes ``python cluster.py`` starts;
+  the shards are split into contiguous ranges between them (default 1)
+
+Each guild lives on exactly one shard, and every event and interaction for it
+arrives at the worker running that shard. The in-memory caches (open-ticket
+index, auto-response matchers, ban index) are all keyed by guild, so each worker
+only loads and maintains its own guilds; the database stays the shared source of
+truth. The launcher applies pending migrations once before starting the workers,
+only worker 0 syncs the command tree, and each worker serves metrics on
+``METRICS_PORT + CLUSTER_ID``.
+
+Discord lets a bot identify ``max_concurrency`` shards (usually 1) per 5 seconds,
+so worker launches are staggered: each waits until the shards of the workers
+before it have had their identify slots.
+"""
+import asyncio
+import collections
+import logging
+import math
+import os
+import signal
+import sys
+
+from ledger import check_path as check_ledger_path
+
+log = logging.getLogger(__name__)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+IDENTIFY_WINDOW = 5.0  # seconds; Discord allows max_concurrency identifies per window
+
+
+def parse_shard_ids(value):
+    """``"0-3,8"`` -> ``[0, 1, 2, 3, 8]``."""
+    shard_ids = []
+    for part in value.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-', 1)
+            shard_ids.extend(range(int(start), int(end) + 1))
+        else:
+            shard_ids.append(int(part))
+    return sorted(set(shard_ids))
+
+
+def guild_shard_id(guild_id, shard_count):
+    # Discord's own routing formula
+    return (int(guild_id) >> 22) % shard_count
+
+
+class ShardConfig:
+    def __init__(self, shard_count=None, shard_ids=None, cluster_id=0):
+        self.shard_count = shard_count  # None: let discord.py ask for the recommended count
+        self.shard_ids = shard_ids      # None: every shard
+        self.cluster_id = cluster_id
+
+    def bot_kwargs(self):
+        kwargs = {}
+        if self.shard_count is not None:
+            kwargs['shard_count'] = self.shard_count
+        if self.shard_ids is not None:
+            kwargs['shard_ids'] = self.shard_ids
+        return kwargs
+
+    def owns_guild(self, guild_id):
+        if self.shard_count is None or self.shard_ids is None:
+            return True
+        return guild_shard_id(guild_id, self.shard_count) in self.shard_ids
+
+
+def shard_config_from_env():
+    """The sharding settings for this process, or None to run unsharded."""
+    shard_count = os.getenv('SHARD_COUNT')
+    shard_ids = os.getenv('SHARD_IDS')
+    if not shard_count and not shard_ids:
+        return None
+    if shard_ids and (not shard_count or shard_count == 'auto'):
+        raise ValueError("SHARD_IDS needs an explicit SHARD_COUNT")
+    return ShardConfig(
+        shard_count=int(shard_count) if shard_count and shard_count != 'auto' else None,
+        shard_ids=parse_shard_ids(shard_ids) if shard_ids else None,
+        cluster_id=int(os.getenv('CLUSTER_ID', '0')),
+    )
+
+
+def shard_stats(bot):
+    """``{shard_id: (latency, guild_count)}`` for the shards this process runs."""
+    guilds = collections.Counter(guild.shard_id for guild in bot.guilds)
+    latencies = getattr(bot, 'latencies', None) or [(bot.shard_id or 0, bot.latency)]
+    return {shard_id: (latency, guilds.get(shard_id, 0)) for shard_id, latency in latencies}
+
+
+def split_shards(shard_count, cluster_count):
+    """Contiguous, as-even-as-possible shard ranges, one per cluster."""
+    cluster_count = max(1, min(cluster_count, shard_count))
+    base, extra = divmod(shard_count, cluster_count)
+    ranges = []
+    start = 0
+    for cluster_id in range(cluster_count):
+        size = base + (1 if cluster_id < extra else 0)
+        ranges.append(list(range(start, start + size)))
+        start += size
+    return ranges
+
+
+def launch_delays(ranges, max_concurrency=1):
+    """Seconds each cluster waits before starting, so their first identifies don't collide."""
+    delays = []
+    shards_before = 0
+    for shard_ids in ranges:
+        delays.append(math.ceil(shards_before / max(1, max_concurrency)) * IDENTIFY_WINDOW)
+        shards_before += len(shard_ids)
+    return delays
+
+
+async def gateway_info(token):
+    """``(recommended_shard_count, identify_max_concurrency)`` from ``/gateway/bot``."""
+    import aiohttp
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get('https://discord.com/api/v10/gateway/bot',
+                               headers={'Authorization': f'Bot {token}'}) as response:
+            response.raise_for_status()
+            data = await response.json()
+            return data['shards'], data['session_start_limit']['max_concurrency']
+
+
+async def migrate_once():
+    """Bring the schema up to date before any worker starts, so they don't race on it."""
+    from database import Database
+    from migrations import migrate
+
+    db = Database(pool_size=1)
+    try:
+        if await db.connect():
+            version = await migrate(db)
+            log.info(f"Database schema is at version {version}.")
+    except Exception as e:
+        log.error(f"Error migrating database before starting workers: {e}")
+    finally:
+        await db.close()
+
+
+async def run_worker(cluster_id, shard_ids, shard_count, stopping, delay=0):
+    env = dict(os.environ)
+    env.update({
+        'SHARD_COUNT': str(shard_count),
+        'SHARD_IDS': ','.join(map(str, shard_ids)),
+        'CLUSTER_ID': str(cluster_id),
+    })
+    metrics_port = int(os.getenv('METRICS_PORT', '9100'))
+    if metrics_port:
+        env['METRICS_PORT'] = str(metrics_port + cluster_id)
+
+    if delay:
+        log.info(f"Cluster {cluster_id} starts in {delay:.0f}s, after the identifies of the clusters before it")
+        try:
+            await asyncio.wait_for(stopping.wait(), timeout=delay)
+            return
+        except asyncio.TimeoutError:
+            pass
+
+    restarts = 0
+    while not stopping.is_set():
+        log.info(f"Starting cluster {cluster_id} with shards {shard_ids[0]}-{shard_ids[-1]} of {shard_count}")
+        process = await asyncio.create_subprocess_exec(sys.executable, os.path.join(ROOT, 'bot.py'), env=env)
+        waiter = asyncio.ensure_future(process.wait())
+        stopper = asyncio.ensure_future(stopping.wait())
+        await asyncio.wait((waiter, stopper), return_when=asyncio.FIRST_COMPLETED)
+        if stopping.is_set():
+            if process.returncode is None:
+                process.terminate()
+                await process.wait()
+            return
+        stopper.cancel()
+        restarts += 1
+        delay = min(60, 2 ** min(restarts, 6))
+        log.warning(f"Cluster {cluster_id} exited with code {process.returncode}, restarting in {delay}s")
+        try:
+            await asyncio.wait_for(stopping.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    # Fail here rather than in every worker, which would just be restarted
+    check_ledger_path()
+    cluster_count = int(os.getenv('CLUSTER_COUNT', '1'))
+    shard_count = os.getenv('SHARD_COUNT')
+
+    if cluster_count <= 1 and not shard_count:
+        # Nothing to split: run the bot in this process exactly as before
+        os.execv(sys.executable, [sys.executable, os.path.join(ROOT, 'bot.py')])
+
+    max_concurrency = 1
+    try:
+        recommended, max_concurrency = await gateway_info(os.getenv('DISCORD_TOKEN'))
+    except Exception as e:
+        if not shard_count or shard_count == 'auto':
+            raise
+        log.warning(f"Could not read identify concurrency from Discord, assuming 1: {e}")
+    if not shard_count or shard_count == 'auto':
+        shard_count = recommended
+        log.info(f"Discord recommends {shard_count} shards")
+    shard_count = int(shard_count)
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stopping.set)
+        except NotImplementedError:
+            pass  # Windows
+
+    await migrate_once()
+    ranges = split_shards(shard_count, cluster_count)
+    delays = launch_delays(ranges, max_concurrency)
+    await asyncio.gather(*(run_worker(cluster_id, shard_ids, shard_count, stopping, delay)
+                           for cluster_id, (shard_ids, delay) in enumerate(zip(ranges, delays))))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s cluster: %(message)s')
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+"""Skip redundant application command syncs.
+
+``tree.sync()`` is a rate-limited REST call, and the command tree only changes
+when the code does. The tree is serialized (names, options, permissions, ...)
+and hashed; the hash of the last successful sync is kept in the
+``command_sync`` table and the sync is skipped when nothing changed. Container
+and dyno filesystems are wiped on every deploy, so the database is what lets a
+rolling restart skip the sync. Without a database the hash falls back to a small
+JSON file.
+
+Settings (environment variables):
+
+- ``COMMAND_SYNC_CACHE``: the fallback file (default ``.command_sync.json``)
+- ``DEV_GUILD_ID``: sync the commands to this guild only, for development
+- ``FORCE_COMMAND_SYNC``: set to ``1`` to sync even if the hash matches
+"""
+import hashlib
+import json
+import logging
+import os
+
+import discord
+
+log = logging.getLogger(__name__)
+
+CACHE_PATH = os.getenv('COMMAND_SYNC_CACHE', '.command_sync.json')
+
+
+def tree_hash(tree, guild=None):
+    """Stable hash of every command registered on ``tree`` for ``guild`` (None for global)."""
+    payload = sorted((command.to_dict() for command in tree.get_commands(guild=guild)),
+                     key=lambda c: (c.get('type', 1), c['name']))
+    serialized = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+
+def _load_cache():
+    try:
+        with open(CACHE_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(cache):
+    tmp_path = CACHE_PATH + '.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, indent=2)
+        os.replace(tmp_path, CACHE_PATH)
+    except OSError as e:
+        log.warning(f"Could not save command sync cache: {e}")
+
+
+async def _load_digest(db, key):
+    if db is None:
+        return _load_cache().get(key)
+    try:
+        row = await db.fetchone('SELECT digest FROM command_sync WHERE sync_key = ?', (key,))
+    except Exception as e:
+        log.warning(f"Could not read command sync hash: {e}")
+        return None
+    return row[0] if row else None
+
+
+async def _save_digest(db, key, digest):
+    if db is None:
+        cache = _load_cache()
+        cache[key] = digest
+        _save_cache(cache)
+        return
+    try:
+        await db.execute('INSERT OR REPLACE INTO command_sync (sync_key, digest) VALUES (?, ?)', (key, digest))
+    except Exception as e:
+        log.warning(f"Could not save command sync hash: {e}")
+
+
+async def sync_if_changed(tree, db=None):
+    """Sync the command tree if it changed since the last sync. Returns True if it synced.
+
+    The hash is kept in ``db`` when given, otherwise in ``COMMAND_SYNC_CACHE``.
+    """
+    dev_guild_id = os.getenv('DEV_GUILD_ID')
+    guild = None
+    key = 'global'
+    if dev_guild_id:
+        guild = discord.Object(id=int(dev_guild_id))
+        tree.copy_global_to(guild=guild)
+        key = f'guild:{dev_guild_id}'
+
+    digest = tree_hash(tree, guild=guild)
+    if await _load_digest(db, key) == digest and os.getenv('FORCE_COMMAND_SYNC') != '1':
+        log.info(f"Slash commands unchanged ({key}), skipping sync.")
+        return False
+
+    await tree.sync(guild=guild)
+    await _save_digest(db, key, digest)
+    log.info(f"Slash commands synced ({key}).")
+    return True
@@ -0,0 +1,292 @@
+"""Async access to the bot's database.
+
+The sqlitecloud driver is blocking, so every query runs on a small thread pool
+instead of on the discord.py event loop. Handlers just ``await db.fetchone(...)``
+or ``await db.execute(...)``.
+
+Queries go through a pool of connections: each operation checks one out, runs
+on its own cursor and hands it back, so concurrent interactions never share a
+cursor. Idle connections are health-checked by a background task, and a
+connection is only rebuilt (with jittered backoff) when a query on it fails.
+
+Settings (environment variables):
+
+- ``DB_POOL_SIZE``: number of connections to keep open (default 4)
+- ``DB_POOL_TIMEOUT``: seconds to wait for a free connection (default 10)
+- ``DB_HEALTH_CHECK_INTERVAL``: seconds between idle health checks (default 60)
+- ``SQLITE_PATH``: use a local SQLite file instead of SQLiteCloud, which is
+  handy for testing and benchmarks
+"""
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import DBTimer
+
+log = logging.getLogger(__name__)
+
+
+def connection_factory_from_env():
+    """Return a zero-argument callable that opens a new DB connection, or None if
+    the environment is not configured."""
+    sqlite_path = os.getenv('SQLITE_PATH')
+    if sqlite_path:
+        return lambda: sqlite3.connect(sqlite_path, check_same_thread=False)
+
+    # Get database connection details from environment variables
+    api_key = os.getenv('SQLITECLOUD_API_KEY')
+    db_name = os.getenv('SQLITECLOUD_DB')
+    host = os.getenv('SQLITECLOUD_HOST')
+    port = os.getenv('SQLITECLOUD_PORT')
+
+    # Validate environment variables
+    for var, value in (('SQLITECLOUD_API_KEY', api_key), ('SQLITECLOUD_DB', db_name),
+                       ('SQLITECLOUD_HOST', host), ('SQLITECLOUD_PORT', port)):
+        if not value:
+            log.error(f"Error: {var} environment variable is not set")
+            return None
+
+    import sqlitecloud  # Only needed when talking to SQLiteCloud
+
+    connection_string = f"sqlitecloud://{host}:{port}/{db_name}?apikey={api_key}"
+    return lambda: sqlitecloud.connect(connection_string)
+
+
+def backoff_delay(attempt, base=0.5, cap=30.0):
+    """Exponential backoff with +/-50% jitter so workers don't reconnect in lockstep."""
+    return min(cap, base * (2 ** attempt)) * random.uniform(0.5, 1.5)
+
+
+class PoolTimeout(Exception):
+    """No connection became free within ``DB_POOL_TIMEOUT`` seconds."""
+
+
+class _PooledConnection:
+    __slots__ = ('raw', 'last_used')
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.last_used = time.monotonic()
+
+
+class Database:
+    """A fixed-size pool of DB connections driven from worker threads."""
+
+    def __init__(self, connect=None, pool_size=None, pool_timeout=None, health_check_interval=None):
+        self._connect = connect
+        self.pool_size = pool_size or int(os.getenv('DB_POOL_SIZE', '4'))
+        self.pool_timeout = pool_timeout or float(os.getenv('DB_POOL_TIMEOUT', '10'))
+        self.health_check_interval = health_check_interval or float(os.getenv('DB_HEALTH_CHECK_INTERVAL', '60'))
+        self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix='db')
+        self._idle = None
+        self._connections = []
+        self._health_task = None
+
+    @property
+    def connected(self):
+        return bool(self._connections)
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _open(self):
+        raw = self._connect()
+        # Test the connection with a simple query
+        raw.cursor().execute('SELECT 1')
+        return raw
+
+    @staticmethod
+    def _close_raw(raw):
+        try:
+            raw.close()
+        except Exception as close_err:
+            log.error(f"Error closing database connection: {close_err}")
+
+    @staticmethod
+    def _ping(raw):
+        raw.cursor().execute('SELECT 1')
+
+    async def connect(self, max_retries=3):
+        """Open the pool, retrying with jittered backoff between attempts."""
+        if self._connect is None:
+            self._connect = connection_factory_from_env()
+            if self._connect is None:
+                log.error("Please check your SQLiteCloud environment variables (API_KEY, DB, HOST, PORT)")
+                return False
+
+        await self.close()
+        log.info(f"Attempting to connect to database (pool size {self.pool_size})...")
+        for attempt in range(max_retries):
+            try:
+                raws = await asyncio.gather(*(self._run(self._open) for _ in range(self.pool_size)),
+                                            return_exceptions=True)
+                errors = [r for r in raws if isinstance(r, BaseException)]
+                if errors:
+                    for raw in raws:
+                        if not isinstance(raw, BaseException):
+                            self._close_raw(raw)
+                    raise errors[0]
+                self._idle = asyncio.Queue()
+                self._connections = [_PooledConnection(raw) for raw in raws]
+                for pooled in self._connections:
+                    self._idle.put_nowait(pooled)
+                self._health_task = asyncio.create_task(self._health_check_loop())
+                log.info("Successfully connected to the database!")
+                return True
+            except Exception as e:
+                log.warning(f"Database connection attempt failed: {e}")
+                if attempt + 1 < max_retries:
+                    delay = backoff_delay(attempt, base=2.0)
+                    log.warning(f"Retrying in {delay:.1f} seconds... (Attempt {attempt + 2} of {max_retries})")
+                    await asyncio.sleep(delay)
+        log.error("Max retries reached. Could not connect to database.")
+        return False
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        connections, self._connections = self._connections, []
+        for pooled in connections:
+            await self._run(self._close_raw, pooled.raw)
+        self._idle = None
+
+    async def _acquire(self):
+        if self._idle is None:
+            raise RuntimeError("Database is not connected")
+        try:
+            return await asyncio.wait_for(self._idle.get(), timeout=self.pool_timeout)
+        except asyncio.TimeoutError:
+            raise PoolTimeout(f"No database connection free after {self.pool_timeout}s") from None
+
+    def _release(self, pooled):
+        pooled.last_used = time.monotonic()
+        if self._idle is not None and pooled in self._connections:
+            self._idle.put_nowait(pooled)
+
+    async def _reconnect(self, pooled, max_retries=5):
+        """Replace a dead connection in place. Raises the last error if it stays down."""
+        self._close_raw(pooled.raw)
+        for attempt in range(max_retries):
+            try:
+                pooled.raw = await self._run(self._open)
+                return
+            except Exception as e:
+                log.warning(f"Database reconnect attempt {attempt + 1} failed: {e}")
+                if attempt + 1 == max_retries:
+                    raise
+                await asyncio.sleep(backoff_delay(attempt))
+
+    async def _is_alive(self, pooled):
+        try:
+            await self._run(self._ping, pooled.raw)
+            return True
+        except Exception:
+            return False
+
+    async def _health_check_loop(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            if self._idle is None:
+                return
+            # Only look at connections that are idle right now; busy ones prove themselves.
+            # Take them one at a time, so a slow reconnect keeps just that one out of the pool.
+            for _ in range(self._idle.qsize()):
+                if self._idle is None or self._idle.empty():
+                    break
+                pooled = self._idle.get_nowait()
+                try:
+                    if time.monotonic() - pooled.last_used >= self.health_check_interval and not await self._is_alive(pooled):
+                        log.warning("Idle database connection failed its health check, reconnecting...")
+                        await self._reconnect(pooled)
+                except Exception as e:
+                    log.error(f"Error during database health check: {e}")
+                finally:
+                    self._release(pooled)
+
+    @staticmethod
+    def _query(raw, sql, params, fetch):
+        cursor = raw.cursor()
+        try:
+            cursor.execute(sql, params)
+        except Exception:
+            if fetch == 'commit':
+                # A failed write (e.g. a constraint violation) must not leave its
+                # transaction open and holding the write lock on a pooled connection
+                try:
+                    raw.rollback()
+                except Exception:
+                    pass
+            raise
+        if fetch == 'one':
+            return cursor.fetchone()
+        if fetch == 'all':
+            return cursor.fetchall()
+        raw.commit()
+        return cursor.lastrowid
+
+    async def _execute(self, sql, params, fetch):
+        with DBTimer(sql):
+            pooled = await self._acquire()
+            try:
+                try:
+                    return await self._run(self._query, pooled.raw, sql, params, fetch)
+                except Exception:
+                    # Query errors (bad SQL, constraint violations) leave the connection
+                    # healthy; only rebuild it when it no longer answers at all.
+                    if await self._is_alive(pooled):
+                        raise
+                    await self._reconnect(pooled)
+                    if fetch == 'commit':
+                        # The write may or may not have landed; let the caller decide.
+                        raise
+                    return await self._run(self._query, pooled.raw, sql, params, fetch)
+            finally:
+                self._release(pooled)
+
+    @staticmethod
+    def _transaction(raw, func, args):
+        cursor = raw.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            result = func(cursor, *args)
+            raw.commit()
+            return result
+        except BaseException:
+            try:
+                raw.rollback()
+            except Exception:
+                pass
+            raise
+
+    async def transaction(self, func, *args):
+        """Run ``func(cursor, *args)`` in one write transaction on a single connection.
+
+        Everything ``func`` executes is committed together, or rolled back if it
+        raises. ``func`` runs on a worker thread and must not touch the event loop.
+        """
+        with DBTimer('TRANSACTION'):
+            pooled = await self._acquire()
+            try:
+                return await self._run(self._transaction, pooled.raw, func, args)
+            except Exception:
+                if not await self._is_alive(pooled):
+                    await self._reconnect(pooled)
+                raise
+            finally:
+                self._release(pooled)
+
+    async def execute(self, sql, params=()):
+        """Run a write statement and commit it. Returns the cursor's lastrowid."""
+        return await self._execute(sql, params, 'commit')
+
+    async def fetchone(self, sql, params=()):
+        return await self._execute(sql, params, 'one')
+
+    async def fetchall(self, sql, params=()):
+        return await self._execute(sql, params, 'all')
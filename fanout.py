@@ -0,0 +1,106 @@
+"""Bounded-concurrency fan-out of per-channel REST calls.
+
+Setting up a role like "Muted" means one ``set_permissions`` call per channel.
+Doing them one after another takes minutes in big guilds; firing them all at
+once just queues them behind discord.py's per-route rate limiter (and risks
+the global limit). ``fan_out`` runs a fixed number at a time and reports
+progress; discord.py itself still waits out each route's bucket and retries 429s.
+
+``FANOUT_CONCURRENCY`` sets how many calls are in flight at once (default 4).
+"""
+import asyncio
+import logging
+import os
+import time
+
+import discord
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = int(os.getenv('FANOUT_CONCURRENCY', '4'))
+
+
+async def fan_out(items, apply, concurrency=None, on_progress=None, progress_interval=2.0):
+    """Await ``apply(item)`` for every item, at most ``concurrency`` at a time.
+
+    ``on_progress(done, failed, total)`` is awaited at most every
+    ``progress_interval`` seconds and once at the end. Returns ``(done, failed)``
+    where ``failed`` is a list of ``(item, exception)``.
+    """
+    items = list(items)
+    total = len(items)
+    concurrency = concurrency or DEFAULT_CONCURRENCY
+    semaphore = asyncio.Semaphore(concurrency)
+    done = 0
+    failed = []
+    last_report = time.monotonic()
+
+    async def report(force=False):
+        nonlocal last_report
+        if on_progress is None:
+            return
+        now = time.monotonic()
+        if force or now - last_report >= progress_interval:
+            last_report = now
+            try:
+                await on_progress(done, failed, total)
+            except Exception as e:
+                log.error(f"Error reporting fan-out progress: {e}")
+
+    async def run(item):
+        nonlocal done
+        async with semaphore:
+            try:
+                await apply(item)
+                done += 1
+            except Exception as e:
+                failed.append((item, e))
+        await report()
+
+    await asyncio.gather(*(run(item) for item in items))
+    await report(force=True)
+    return done, failed
+
+
+def pending_overwrite_targets(guild, target, overwrite):
+    """Channels whose overwrite for ``target`` doesn't match yet, categories first.
+
+    Channels that already carry the overwrite are skipped, which is what makes an
+    interrupted setup resumable. Categories go first so channels created in them
+    later (and synced to them) pick the overwrite up.
+    """
+    categories = []
+    channels = []
+    for channel in guild.channels:
+        if channel.overwrites_for(target) == overwrite:
+            continue
+        if isinstance(channel, discord.CategoryChannel):
+            categories.append(channel)
+        else:
+            channels.append(channel)
+    return categories, channels
+
+
+async def apply_overwrite(guild, target, overwrite, reason=None, on_progress=None):
+    """Apply ``overwrite`` for ``target`` to every channel in the guild that lacks it.
+
+    Returns ``(done, failed, total)`` across categories and channels.
+    """
+    categories, channels = pending_overwrite_targets(guild, target, overwrite)
+    total = len(categories) + len(channels)
+
+    async def set_overwrite(channel):
+        await channel.set_permissions(target, overwrite=overwrite, reason=reason)
+
+    done = 0
+    failed = []
+
+    async def progress(batch_done, batch_failed, _):
+        await on_progress(done + batch_done, failed + batch_failed, total)
+
+    for batch in (categories, channels):
+        batch_done, batch_failed = await fan_out(batch, set_overwrite,
+                                                 on_progress=progress if on_progress else None)
+        done += batch_done
+        failed += batch_failed
+    return done, failed, total
@@ -0,0 +1,287 @@
+"""Append-only economy ledger.
+
+Replaces the whole-file ``economy.json`` / ``tickets.json`` stores. Every change
+is a row appended to the ``transactions`` table of a local SQLite file in WAL
+mode. Balances live in memory and are updated as transactions are recorded, so
+reading a balance is a dict lookup.
+
+Writes are group-committed: ``record`` updates the balance right away and queues
+the row, and a background flusher commits everything queued in one transaction
+(one fsync) every ``LEDGER_FLUSH_INTERVAL`` seconds. Await ``flush()`` when a
+caller needs the write on disk before continuing.
+
+Balances are per user, not per guild, so in cluster mode (see cluster.py) every
+worker process on the host shares the file: each flush also picks up the
+transactions the other workers committed since the last one.
+
+Every ``LEDGER_SNAPSHOT_EVERY`` transactions the balances are written to a
+snapshot table, so startup loads the snapshot and replays only the transactions
+recorded after it.
+
+The file must live on persistent storage: the default ``economy.db`` sits in
+the working directory, which Docker and Heroku throw away on every redeploy.
+On Heroku (``DYNO`` set) the bot refuses to start until ``LEDGER_PATH`` is set.
+
+Import the legacy JSON files once with::
+
+    python ledger.py import economy.json tickets.json
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+LEDGER_PATH = os.getenv('LEDGER_PATH', 'economy.db')
+FLUSH_INTERVAL = float(os.getenv('LEDGER_FLUSH_INTERVAL', '0.2'))
+SNAPSHOT_EVERY = int(os.getenv('LEDGER_SNAPSHOT_EVERY', '10000'))
+
+COINS = 'coins'
+TICKETS = 'tickets'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS transactions (
+    tx_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    asset TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    issuer_id TEXT,
+    reason TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS snapshot_balances (
+    user_id TEXT NOT NULL,
+    asset TEXT NOT NULL,
+    balance INTEGER NOT NULL,
+    PRIMARY KEY (user_id, asset)
+);
+CREATE TABLE IF NOT EXISTS ledger_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+
+
+def check_path():
+    """Raise if the ledger would be written somewhere that doesn't survive a restart."""
+    if os.getenv('DYNO') and not os.getenv('LEDGER_PATH'):
+        raise RuntimeError("LEDGER_PATH is not set: Heroku wipes the working directory on every restart, "
+                           "so balances in the default economy.db would be lost. Point it at persistent storage.")
+
+
+class LedgerStore:
+    """Synchronous side of the ledger. Owns the SQLite connection."""
+
+    def __init__(self, path=LEDGER_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        # Each group commit is one fsync
+        self.conn.execute('PRAGMA synchronous=FULL')
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+        self.tx_since_snapshot = 0
+        # Highest tx_id already reflected in the caller's balances
+        self.seen_tx_id = 0
+
+    def close(self):
+        self.conn.close()
+
+    def _meta(self, key, default=None):
+        row = self.conn.execute('SELECT value FROM ledger_meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key, value):
+        self.conn.execute('INSERT OR REPLACE INTO ledger_meta (key, value) VALUES (?, ?)', (key, str(value)))
+
+    def load_balances(self):
+        """Snapshot plus every transaction recorded after it."""
+        balances = {}
+        for user_id, asset, balance in self.conn.execute('SELECT user_id, asset, balance FROM snapshot_balances'):
+            balances[(user_id, asset)] = balance
+        self.seen_tx_id = int(self._meta('snapshot_tx_id', 0))
+        replayed = self._read_new()
+        for user_id, asset, amount in replayed:
+            key = (user_id, asset)
+            balances[key] = balances.get(key, 0) + amount
+        self.tx_since_snapshot = len(replayed)
+        return balances, len(replayed)
+
+    def _read_new(self):
+        rows = self.conn.execute('SELECT tx_id, user_id, asset, amount FROM transactions WHERE tx_id > ? ORDER BY tx_id',
+                                 (self.seen_tx_id,)).fetchall()
+        if rows:
+            self.seen_tx_id = rows[-1][0]
+        return [row[1:] for row in rows]
+
+    def append(self, rows):
+        """Commit a batch of ``(user_id, asset, amount, issuer_id, reason)`` rows in one transaction.
+
+        Returns the ``(user_id, asset, amount)`` rows other processes committed
+        since the previous call, which the caller still has to apply.
+        """
+        if not rows:
+            return self._read_new()
+        # IMMEDIATE takes the write lock first, so nothing lands between the read and our insert
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            foreign = self._read_new()
+            self.conn.executemany(
+                'INSERT INTO transactions (user_id, asset, amount, issuer_id, reason) VALUES (?, ?, ?, ?, ?)', rows)
+            self.seen_tx_id = self.conn.execute('SELECT MAX(tx_id) FROM transactions').fetchone()[0]
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        self.tx_since_snapshot += len(rows)
+        return foreign
+
+    def snapshot(self, balances):
+        """Replace the snapshot with ``balances``, which must include every transaction up to ``seen_tx_id``.
+
+        Skipped (returns False) if another process has appended since.
+        """
+        with self.conn:
+            last_tx_id = self.conn.execute('SELECT COALESCE(MAX(tx_id), 0) FROM transactions').fetchone()[0]
+            if last_tx_id != self.seen_tx_id:
+                return False
+            self.conn.execute('DELETE FROM snapshot_balances')
+            self.conn.executemany('INSERT INTO snapshot_balances (user_id, asset, balance) VALUES (?, ?, ?)',
+                                  [(user_id, asset, balance) for (user_id, asset), balance in balances.items()])
+            self._set_meta('snapshot_tx_id', last_tx_id)
+        self.tx_since_snapshot = 0
+        return True
+
+    def import_json(self, economy_path=None, tickets_path=None):
+        """One-shot import of the legacy JSON stores. Files already imported are skipped."""
+        imported = 0
+        for path, rows_from in ((economy_path, _economy_rows), (tickets_path, _ticket_rows)):
+            if not path or not os.path.exists(path):
+                continue
+            key = f'imported:{os.path.basename(path)}'
+            if self._meta(key):
+                log.info(f"{path} was already imported, skipping.")
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            rows = list(rows_from(data))
+            with self.conn:
+                self.conn.executemany(
+                    'INSERT INTO transactions (user_id, asset, amount, issuer_id, reason) VALUES (?, ?, ?, ?, ?)', rows)
+                self._set_meta(key, len(rows))
+            self.tx_since_snapshot += len(rows)
+            imported += len(rows)
+            log.info(f"Imported {len(rows)} transactions from {path}.")
+        return imported
+
+
+def _economy_rows(data):
+    # economy.json maps a user ID to a balance, either bare or as {"balance": n}
+    for user_id, value in data.items():
+        balance = value.get('balance', 0) if isinstance(value, dict) else value
+        if balance:
+            yield (str(user_id), COINS, int(balance), None, 'import:economy.json')
+
+
+def _ticket_rows(data):
+    # tickets.json maps a user ID to a list of {"amount", "issuer_id"} grants
+    for user_id, entries in data.items():
+        for entry in entries:
+            issuer_id = entry.get('issuer_id')
+            yield (str(user_id), TICKETS, int(entry.get('amount', 0)),
+                   str(issuer_id) if issuer_id is not None else None, 'import:tickets.json')
+
+
+class Ledger:
+    """Async front end: in-memory balances with group-committed writes."""
+
+    def __init__(self, path=LEDGER_PATH):
+        self.path = path
+        self._store = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ledger')
+        self._balances = {}
+        self._pending = []
+        self._flush_task = None
+        self._flush_lock = None
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def open(self):
+        if self.path == LEDGER_PATH and not os.getenv('LEDGER_PATH'):
+            log.warning(f"LEDGER_PATH is not set, keeping balances in {os.path.abspath(self.path)}; "
+                        f"make sure it is on a persistent volume")
+        self._store = await self._run(LedgerStore, self.path)
+        self._balances, replayed = await self._run(self._store.load_balances)
+        self._flush_lock = asyncio.Lock()
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        log.info(f"Ledger loaded: {len(self._balances)} balances, {replayed} transactions replayed since the last snapshot.")
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        if self._store is not None:
+            await self.flush()
+            await self._run(self._store.close)
+            self._store = None
+
+    def balance(self, user_id, asset=COINS):
+        return self._balances.get((str(user_id), asset), 0)
+
+    def record(self, user_id, amount, asset=COINS, issuer_id=None, reason=None):
+        """Apply a transaction in memory and queue it for the next group commit.
+
+        Returns the new balance.
+        """
+        if self._store is None:
+            raise RuntimeError("Ledger is not open")
+        key = (str(user_id), asset)
+        balance = self._balances.get(key, 0) + int(amount)
+        self._balances[key] = balance
+        self._pending.append((key[0], asset, int(amount), str(issuer_id) if issuer_id is not None else None, reason))
+        return balance
+
+    async def flush(self):
+        """Commit every queued transaction, pick up other workers' transactions,
+        and snapshot if enough have piled up."""
+        async with self._flush_lock:
+            rows, self._pending = self._pending, []
+            try:
+                foreign = await self._run(self._store.append, rows)
+            except Exception:
+                # Keep the rows for the next attempt
+                self._pending = rows + self._pending
+                raise
+            for user_id, asset, amount in foreign:
+                key = (user_id, asset)
+                self._balances[key] = self._balances.get(key, 0) + amount
+            if self._store.tx_since_snapshot >= SNAPSHOT_EVERY and not self._pending:
+                await self._run(self._store.snapshot, dict(self._balances))
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                log.error(f"Error flushing ledger: {e}")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    if len(sys.argv) >= 2 and sys.argv[1] == 'import':
+        economy_path = sys.argv[2] if len(sys.argv) > 2 else 'economy.json'
+        tickets_path = sys.argv[3] if len(sys.argv) > 3 else 'tickets.json'
+        store = LedgerStore()
+        store.import_json(economy_path, tickets_path)
+        balances, _ = store.load_balances()
+        store.snapshot(balances)
+        store.close()
+    else:
+        print("Usage: python ledger.py import [economy.json] [tickets.json]")
@@ -0,0 +1,98 @@
+"""Memory-lean cache settings and cache-size reporting.
+
+discord.py keeps every member of every guild it has seen, chunks every guild at
+startup and caches the last 1000 messages. The bot itself only needs a member
+when a command targets one, and slash command options already arrive with the
+member in the interaction payload. ``LOW_MEMORY=1`` turns the member cache
+(except the bot's own member) and startup chunking off and disables the message
+cache.
+
+Settings (environment variables):
+
+- ``LOW_MEMORY``: ``1`` for the lean profile (default ``0``)
+- ``MESSAGE_CACHE_SIZE``: messages to keep; ``0`` disables the cache
+  (default 1000, or 0 with ``LOW_MEMORY``)
+- ``CHUNK_GUILDS_AT_STARTUP``: ``1``/``0`` to override the profile's choice
+"""
+import logging
+import os
+
+import discord
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+LOW_MEMORY = os.getenv('LOW_MEMORY', '0') == '1'
+
+CACHE_ENTRIES = metrics.Gauge('bot_cache_entries', 'Objects held in the discord.py caches', ['cache'])
+RESIDENT_MEMORY = metrics.Gauge('process_resident_memory_bytes', 'Resident set size of the process')
+
+
+def client_options(intents):
+    """Keyword arguments for the Bot constructor under the configured profile."""
+    message_cache_size = int(os.getenv('MESSAGE_CACHE_SIZE', '0' if LOW_MEMORY else '1000'))
+    chunk_at_startup = os.getenv('CHUNK_GUILDS_AT_STARTUP')
+    if chunk_at_startup is None:
+        chunk_at_startup = intents.members and not LOW_MEMORY
+    else:
+        chunk_at_startup = chunk_at_startup == '1'
+
+    if LOW_MEMORY:
+        member_cache_flags = discord.MemberCacheFlags.none()
+    else:
+        member_cache_flags = discord.MemberCacheFlags.from_intents(intents)
+
+    return {
+        'member_cache_flags': member_cache_flags,
+        # discord.py treats 0 as "use the default", None disables the cache
+        'max_messages': message_cache_size or None,
+        'chunk_guilds_at_startup': chunk_at_startup,
+    }
+
+
+def guild_cache_sizes(guild):
+    return {
+        'members': len(guild._members),
+        'channels': len(guild._channels),
+        'roles': len(guild._roles),
+        'emojis': len(guild.emojis),
+    }
+
+
+def cache_totals(bot):
+    totals = {'guilds': len(bot.guilds), 'users': len(bot.users), 'messages': len(bot.cached_messages)}
+    for guild in bot.guilds:
+        for cache, size in guild_cache_sizes(guild).items():
+            totals[cache] = totals.get(cache, 0) + size
+    return totals
+
+
+def resident_memory():
+    """Current RSS in bytes, or None where /proc isn't available."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def track_caches(bot):
+    CACHE_ENTRIES.set_function(lambda: {(cache,): size for cache, size in cache_totals(bot).items()})
+    RESIDENT_MEMORY.set_function(lambda: resident_memory() or 0)
+
+
+def memory_report(bot, guild=None):
+    """Plain-text summary of cache sizes: the worker's totals and this guild.
+
+    Shown to server admins, so it never names other guilds; per-cache totals are on /metrics.
+    """
+    rss = resident_memory()
+    lines = [f"Profile: {'low-memory' if LOW_MEMORY else 'default'}"
+             + (f", RSS {rss / 1024 / 1024:.1f} MiB" if rss else "")]
+    totals = cache_totals(bot)
+    lines.append("Total: " + ", ".join(f"{size} {cache}" for cache, size in totals.items()))
+    if guild is not None:
+        lines.append("This server: " + ", ".join(f"{size} {cache}" for cache, size in guild_cache_sizes(guild).items())
+                     + f" (chunked: {'yes' if guild.chunked else 'no'})")
+    return "\n".join(lines)
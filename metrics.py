@@ -0,0 +1,378 @@
+"""Metrics, structured logging and a sampling profiler.
+
+- Latency histograms and error counters for every app command, UI component
+  callback and DB query, plus Discord rate-limit counts (429s and exhausted
+  buckets) and event-loop lag.
+  They are served as Prometheus text on ``http://METRICS_HOST:METRICS_PORT/metrics``
+  (default ``127.0.0.1:9100``; ``METRICS_PORT=0`` turns the endpoint off).
+- Log records carry the guild, user and command of the interaction they were
+  logged from, as ``key=value`` pairs.
+- ``GET /debug/profile?seconds=N`` samples the event-loop thread for N seconds
+  and returns the stacks in collapsed (flame graph) format.
+"""
+import asyncio
+import collections
+import contextvars
+import functools
+import logging
+import math
+import os
+import sys
+import threading
+import time
+
+import discord
+from discord import app_commands
+
+log = logging.getLogger(__name__)
+
+# guild/user/command of the interaction being handled, copied into every log record
+log_context = contextvars.ContextVar('log_context', default={})
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+# --- Logging --- #
+
+class ContextFilter(logging.Filter):
+    def filter(self, record):
+        for key, value in log_context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class StructuredFormatter(logging.Formatter):
+    """``time level logger msg="..." key=value ...``, one line per record."""
+
+    FIELDS = ('guild', 'user', 'command')
+
+    def format(self, record):
+        message = record.getMessage().replace('"', '\\"')
+        parts = [self.formatTime(record, '%Y-%m-%dT%H:%M:%S'), record.levelname, record.name, f'msg="{message}"']
+        for field in self.FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                parts.append(f'{field}={value}')
+        line = ' '.join(parts)
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+def setup_logging(level=None):
+    level = level or os.getenv('LOG_LEVEL', 'INFO')
+    handler = logging.StreamHandler()
+    handler.setFormatter(StructuredFormatter())
+    handler.addFilter(ContextFilter())
+    # The level is applied on the output handler, so discord.http can still hand its
+    # DEBUG-level bucket exhaustion records to RateLimitHandler without printing them
+    handler.setLevel(level)
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    http_log = logging.getLogger('discord.http')
+    http_log.setLevel(logging.DEBUG)
+    http_log.addHandler(RateLimitHandler())
+
+
+# --- Metric types --- #
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = collections.defaultdict(float)
+        REGISTRY.append(self)
+
+    def inc(self, *label_values, amount=1.0):
+        self._values[label_values] += amount
+
+    def render(self):
+        for label_values, value in sorted(self._values.items()):
+            yield f'{self.name}{_format_labels(self.labels, label_values)} {value}'
+
+
+class Gauge:
+    """A value that is set directly, or computed at scrape time by ``set_function``."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._function = None
+        REGISTRY.append(self)
+
+    def set(self, value, *label_values):
+        self._values[label_values] = value
+
+    def set_function(self, function):
+        """``function()`` returns a number, or a dict of label-value tuples to numbers."""
+        self._function = function
+
+    def render(self):
+        values = self._values
+        if self._function is not None:
+            try:
+                result = self._function()
+            except Exception as e:
+                log.warning(f"Error collecting {self.name}: {e}")
+                return
+            values = result if isinstance(result, dict) else {(): result}
+        for label_values, value in sorted(values.items()):
+            yield f'{self.name}{_format_labels(self.labels, label_values)} {value}'
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._counts = {}  # label values -> [per-bucket counts..., +Inf count]
+        self._sums = collections.defaultdict(float)
+        REGISTRY.append(self)
+
+    def observe(self, value, *label_values):
+        counts = self._counts.get(label_values)
+        if counts is None:
+            counts = self._counts[label_values] = [0] * (len(self.buckets) + 1)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        self._sums[label_values] += value
+
+    def render(self):
+        for label_values, counts in sorted(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                labels = _format_labels(self.labels, label_values, f'le="{le}"')
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _format_labels(self.labels, label_values)
+            yield f'{self.name}_sum{labels} {self._sums[label_values]}'
+            yield f'{self.name}_count{labels} {cumulative}'
+
+
+REGISTRY = []
+
+
+def render_metrics():
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+COMMAND_LATENCY = Histogram('bot_command_duration_seconds', 'App command handler latency', ['command'])
+COMMAND_ERRORS = Counter('bot_command_errors_total', 'App command handlers that raised', ['command'])
+COMPONENT_LATENCY = Histogram('bot_component_duration_seconds', 'UI component callback latency', ['component'])
+COMPONENT_ERRORS = Counter('bot_component_errors_total', 'UI component callbacks that raised', ['component'])
+DB_LATENCY = Histogram('bot_db_query_duration_seconds', 'Database query latency, including pool wait', ['op'])
+DB_ERRORS = Counter('bot_db_query_errors_total', 'Database queries that raised', ['op'])
+RATE_LIMITS = Counter('discord_rate_limited_total', 'Discord 429 responses', ['scope'])
+RATE_LIMIT_WAIT = Counter('discord_rate_limit_wait_seconds_total', 'Seconds spent waiting out Discord 429s; pre-emptive bucket waits are not timed', ['scope'])
+RATE_LIMIT_BUCKETS = Counter('discord_rate_limit_buckets_exhausted_total',
+                             'Rate limit buckets used up, making discord.py hold back the next request until reset')
+SHARD_LATENCY = Gauge('discord_shard_latency_seconds', 'Gateway heartbeat latency per shard', ['shard'])
+SHARD_GUILDS = Gauge('discord_shard_guilds', 'Guilds served per shard', ['shard'])
+LOOP_LAG = Histogram('bot_event_loop_lag_seconds', 'How late the event loop ran a timer',
+                     buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+
+
+# --- Instrumentation --- #
+
+def _interaction_context(interaction, command):
+    return {
+        'guild': getattr(interaction, 'guild_id', None),
+        'user': getattr(interaction.user, 'id', None),
+        'command': command,
+    }
+
+
+def _instrument(callback, name, histogram, errors):
+    @functools.wraps(callback)
+    async def wrapper(*args, **kwargs):
+        interaction = next((a for a in args if isinstance(a, discord.Interaction)), None)
+        token = log_context.set(_interaction_context(interaction, name) if interaction else {'command': name})
+        started = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        except Exception:
+            errors.inc(name)
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - started, name)
+            log_context.reset(token)
+    return wrapper
+
+
+def instrument_tree(tree):
+    """Time every app command registered on ``tree``."""
+    for command in tree.walk_commands():
+        if isinstance(command, app_commands.Command) and not getattr(command._callback, '__instrumented__', False):
+            command._callback = _instrument(command._callback, command.qualified_name, COMMAND_LATENCY, COMMAND_ERRORS)
+            command._callback.__instrumented__ = True
+
+
+def timed_component(name):
+    """Decorator for UI component callbacks."""
+    def decorator(callback):
+        return _instrument(callback, name, COMPONENT_LATENCY, COMPONENT_ERRORS)
+    return decorator
+
+
+class DBTimer:
+    """``with DBTimer(sql):`` records the query's latency and errors by statement type."""
+
+    __slots__ = ('op', 'started')
+
+    def __init__(self, sql):
+        self.op = sql.split(None, 1)[0].upper() if sql.strip() else 'UNKNOWN'
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        DB_LATENCY.observe(time.perf_counter() - self.started, self.op)
+        if exc_type is not None:
+            DB_ERRORS.inc(self.op)
+
+
+class RateLimitHandler(logging.Handler):
+    """Counts the 429s and exhausted rate limit buckets discord.py logs on ``discord.http``.
+
+    An exhausted bucket is discord.py waiting *before* a request so it doesn't get a
+    429; it doesn't log how long, so those waits are counted but not timed.
+    """
+
+    def emit(self, record):
+        if not isinstance(record.msg, str):
+            return
+        try:
+            if record.msg.startswith('We are being rate limited') and 'Retrying' in record.msg:
+                RATE_LIMITS.inc('route')
+                RATE_LIMIT_WAIT.inc('route', amount=float(record.args[2]))
+            elif record.msg.startswith('A rate limit bucket') and 'exhausted' in record.msg:
+                RATE_LIMIT_BUCKETS.inc()
+            elif record.msg.startswith('Global rate limit has been hit'):
+                RATE_LIMITS.inc('global')
+                RATE_LIMIT_WAIT.inc('global', amount=float(record.args[0]))
+        except (IndexError, TypeError, ValueError):
+            pass
+
+
+def track_shards(stats):
+    """Export per-shard latency and guild count; ``stats()`` returns ``{shard_id: (latency, guilds)}``."""
+    def latencies():
+        # Latency is inf until the shard's first heartbeat
+        return {(str(shard_id),): latency for shard_id, (latency, _) in stats().items() if math.isfinite(latency)}
+
+    SHARD_LATENCY.set_function(latencies)
+    SHARD_GUILDS.set_function(lambda: {(str(shard_id),): guilds for shard_id, (_, guilds) in stats().items()})
+
+
+async def monitor_loop_lag(interval=0.5):
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(0.0, loop.time() - started - interval))
+
+
+# --- Profiler --- #
+
+class SamplingProfiler:
+    """Samples one thread's stack at a fixed rate and counts collapsed stacks."""
+
+    def __init__(self, thread_id, interval=0.01):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return '\n'.join(f'{stack} {count}' for stack, count in self.samples.most_common()) + '\n'
+
+
+# --- HTTP endpoint --- #
+
+async def start_server(host=None, port=None):
+    """Serve /metrics and /debug/profile. Returns the aiohttp runner, or None if disabled."""
+    from aiohttp import web
+
+    host = host or os.getenv('METRICS_HOST', '127.0.0.1')
+    port = int(port if port is not None else os.getenv('METRICS_PORT', '9100'))
+    if not port:
+        return None
+
+    profiling = asyncio.Lock()
+    loop_thread_id = threading.get_ident()
+
+    async def metrics_handler(request):
+        return web.Response(text=render_metrics(), content_type='text/plain', charset='utf-8')
+
+    async def profile_handler(request):
+        seconds = min(float(request.query.get('seconds', '10')), 300.0)
+        if profiling.locked():
+            return web.Response(status=409, text='A profile is already running\n')
+        async with profiling:
+            profiler = SamplingProfiler(loop_thread_id)
+            profiler.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profiler.stop()
+        return web.Response(text=profiler.collapsed(), content_type='text/plain')
+
+    app = web.Application()
+    app.router.add_get('/metrics', metrics_handler)
+    app.router.add_get('/debug/profile', profile_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    log.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,174 @@
+"""Versioned schema migrations.
+
+Each migration is a version number, a short description and the SQL statements
+that bring the schema from the previous version to this one. ``migrate`` applies
+the ones newer than the version recorded in ``schema_version`` and records each
+one as it goes, so it runs once at startup and is a no-op afterwards.
+
+To change the schema, append a new migration; never edit one that has shipped.
+"""
+import logging
+import re
+
+log = logging.getLogger(__name__)
+
+MIGRATIONS = [
+    (1, "initial schema", [
+        # Existing deployments already have this table, hence IF NOT EXISTS
+        '''
+        CREATE TABLE IF NOT EXISTS tickets (
+            ticket_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id TEXT,
+            channel_id TEXT UNIQUE,
+            user_id TEXT,
+            category_name TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            status TEXT DEFAULT 'open'
+        )
+        ''',
+        # Cold-path lookup for the duplicate-ticket check
+        '''
+        CREATE INDEX IF NOT EXISTS idx_tickets_guild_user_status
+        ON tickets (guild_id, user_id, status)
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS auto_responses (
+            response_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id TEXT,
+            trigger TEXT,
+            response TEXT,
+            match_mode TEXT DEFAULT 'contains',
+            cooldown INTEGER DEFAULT 0,
+            UNIQUE (guild_id, trigger)
+        )
+        ''',
+        # Tracks whether the Muted role's channel overwrites have all been applied,
+        # so an interrupted setup is picked up again by the next /mute
+        '''
+        CREATE TABLE IF NOT EXISTS mute_setups (
+            guild_id TEXT PRIMARY KEY,
+            role_id TEXT,
+            completed INTEGER DEFAULT 0
+        )
+        ''',
+        # Progress of /clear jobs so they can be resumed after a restart
+        '''
+        CREATE TABLE IF NOT EXISTS purge_jobs (
+            job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id TEXT,
+            channel_id TEXT,
+            requested_by TEXT,
+            max_messages INTEGER,
+            filters TEXT,
+            cursor_id TEXT,
+            deleted INTEGER DEFAULT 0,
+            status TEXT DEFAULT 'running',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (2, "at most one open ticket per user", [
+        # Keep the oldest open ticket of anyone who managed to open several
+        '''
+        UPDATE tickets SET status = 'closed'
+        WHERE status = 'open' AND ticket_id NOT IN (
+            SELECT MIN(ticket_id) FROM tickets WHERE status = 'open' GROUP BY guild_id, user_id
+        )
+        ''',
+        # Tickets are claimed by inserting their row before the channel exists, so
+        # this is what keeps it to one open ticket per user across worker processes
+        '''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_tickets_one_open_per_user
+        ON tickets (guild_id, user_id) WHERE status = 'open'
+        ''',
+    ]),
+    (3, "ticket close details", [
+        'ALTER TABLE tickets ADD COLUMN closed_at TIMESTAMP',
+        'ALTER TABLE tickets ADD COLUMN closed_by TEXT',
+        'ALTER TABLE tickets ADD COLUMN transcript TEXT',
+    ]),
+    (4, "persistent ticket panels", [
+        # category_filter NULL means the panel offers every category in the guild
+        '''
+        CREATE TABLE IF NOT EXISTS ticket_panels (
+            panel_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id TEXT,
+            channel_id TEXT,
+            message_id TEXT UNIQUE,
+            category_filter TEXT,
+            custom_labels TEXT,
+            placeholder TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (5, "command sync hashes", [
+        # Hash of the last synced command tree per scope ('global' or 'guild:<id>'),
+        # kept here because container filesystems don't survive a deploy
+        '''
+        CREATE TABLE IF NOT EXISTS command_sync (
+            sync_key TEXT PRIMARY KEY,
+            digest TEXT,
+            synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+]
+
+
+async def current_version(db):
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    row = await db.fetchone('SELECT MAX(version) FROM schema_version')
+    return row[0] or 0
+
+
+_ADD_COLUMN_RE = re.compile(r'\s*ALTER\s+TABLE\s+(\w+)\s+ADD\s+COLUMN\s+(\w+)', re.IGNORECASE)
+
+
+def _already_added(cursor, statement):
+    """Whether ``statement`` adds a column that exists already.
+
+    Before migrations ran in a transaction, a crash could leave one half applied;
+    this lets such a schema finish the migration instead of failing on it forever.
+    """
+    match = _ADD_COLUMN_RE.match(statement)
+    if match is None:
+        return False
+    table, column = match.groups()
+    cursor.execute(f'PRAGMA table_info({table})')
+    return any(row[1] == column for row in cursor.fetchall())
+
+
+def _apply(cursor, target, description, statements):
+    """Apply one migration inside the caller's transaction. Returns False if it was already applied."""
+    # Re-checked under the write lock: another worker may have applied it meanwhile
+    cursor.execute('SELECT MAX(version) FROM schema_version')
+    if (cursor.fetchone()[0] or 0) >= target:
+        return False
+    for statement in statements:
+        if not _already_added(cursor, statement):
+            cursor.execute(statement)
+    cursor.execute('INSERT INTO schema_version (version, description) VALUES (?, ?)', (target, description))
+    return True
+
+
+async def migrate(db):
+    """Apply every pending migration. Returns the schema version afterwards.
+
+    Each migration runs in its own transaction on one connection, so a crash
+    midway leaves it either fully applied or not at all.
+    """
+    version = await current_version(db)
+    for target, description, statements in MIGRATIONS:
+        if target <= version:
+            continue
+        log.info(f"Applying database migration {target}: {description}")
+        await db.transaction(_apply, target, description, statements)
+        version = target
+    return version
@@ -0,0 +1,187 @@
+"""Persistent ticket panels.
+
+Every panel ``/ticket-setup`` posts is stored in the ``ticket_panels`` table.
+Its select menus get stable custom IDs (``ticket_panel:<panel_id>:<page>``), so
+after a restart one SELECT is enough to register every panel again with
+``bot.add_view``. No REST calls are involved, however many panels there are.
+
+Category options come from a per-guild cache kept current by the
+``on_guild_channel_*`` events. When a guild's categories change, its panels are
+re-rendered the next time someone uses them. A select holds 25 options, so
+guilds with more categories get up to five selects ("pages") per panel.
+"""
+import json
+import logging
+
+log = logging.getLogger(__name__)
+
+OPTIONS_PER_SELECT = 25
+MAX_SELECTS = 5  # one per action row
+CUSTOM_ID_PREFIX = 'ticket_panel'
+
+
+def panel_custom_id(panel_id, page):
+    return f'{CUSTOM_ID_PREFIX}:{panel_id}:{page}'
+
+
+def parse_custom_id(custom_id):
+    """``(panel_id, page)`` for a panel select's custom ID, or None for anything else."""
+    parts = (custom_id or '').split(':')
+    if len(parts) != 3 or parts[0] != CUSTOM_ID_PREFIX:
+        return None
+    try:
+        return int(parts[1]), int(parts[2])
+    except ValueError:
+        return None
+
+
+def paginate(categories):
+    """Split the categories into select-sized pages. Returns ``(pages, dropped)``."""
+    pages = [categories[i:i + OPTIONS_PER_SELECT] for i in range(0, len(categories), OPTIONS_PER_SELECT)]
+    dropped = sum(len(page) for page in pages[MAX_SELECTS:])
+    return pages[:MAX_SELECTS], dropped
+
+
+class CategoryCache:
+    """Each guild's categories in display order, updated from channel events."""
+
+    def __init__(self):
+        self._guilds = {}    # guild_id -> {category_id: CategoryChannel}
+        self._sorted = {}    # guild_id -> [CategoryChannel], rebuilt after a change
+        self._versions = {}  # guild_id -> bumped on every change
+
+    def categories(self, guild):
+        if guild.id not in self._guilds:
+            # Filled once from the guild's channel cache, then kept current by events
+            self._guilds[guild.id] = {category.id: category for category in guild.categories}
+        ordered = self._sorted.get(guild.id)
+        if ordered is None:
+            ordered = sorted(self._guilds[guild.id].values(), key=lambda c: (c.position, c.id))
+            self._sorted[guild.id] = ordered
+        return ordered
+
+    def get(self, guild, category_id):
+        self.categories(guild)
+        return self._guilds[guild.id].get(int(category_id))
+
+    def version(self, guild_id):
+        return self._versions.get(guild_id, 0)
+
+    def _changed(self, guild_id):
+        self._sorted.pop(guild_id, None)
+        self._versions[guild_id] = self.version(guild_id) + 1
+
+    def add(self, category):
+        categories = self._guilds.get(category.guild.id)
+        if categories is not None:
+            categories[category.id] = category
+        self._changed(category.guild.id)
+
+    def remove(self, category):
+        categories = self._guilds.get(category.guild.id)
+        if categories is not None:
+            categories.pop(category.id, None)
+        self._changed(category.guild.id)
+
+    def update(self, before, after):
+        if before.name != after.name or before.position != after.position:
+            self.add(after)
+
+    def forget_guild(self, guild_id):
+        self._guilds.pop(guild_id, None)
+        self._changed(guild_id)
+
+
+class Panel:
+    __slots__ = ('panel_id', 'guild_id', 'channel_id', 'message_id', 'category_filter', 'custom_labels',
+                 'placeholder', 'rendered_version', 'views')
+
+    def __init__(self, panel_id, guild_id, channel_id, message_id, category_filter, custom_labels, placeholder):
+        self.panel_id = panel_id
+        self.guild_id = int(guild_id)
+        self.channel_id = int(channel_id)
+        self.message_id = int(message_id) if message_id else None
+        self.category_filter = int(category_filter) if category_filter else None  # None: every category
+        self.custom_labels = custom_labels or {}
+        self.placeholder = placeholder
+        self.rendered_version = None  # category cache version the posted message shows
+        # Views registered for the message: the one it was loaded or posted with, and the latest re-render
+        self.views = []
+
+
+class PanelStore:
+    """Ticket panel definitions in the DB, and the ones registered in this process."""
+
+    def __init__(self, db, categories):
+        self.db = db
+        self.categories = categories
+        self._panels = {}      # panel_id -> Panel
+        self._by_message = {}  # message_id -> panel_id; checked on every message delete
+
+    def __len__(self):
+        return len(self._panels)
+
+    def get(self, panel_id):
+        return self._panels.get(panel_id)
+
+    async def load(self, owns_guild=None):
+        """Every posted panel, in one query. Returns the loaded panels."""
+        rows = await self.db.fetchall(
+            'SELECT panel_id, guild_id, channel_id, message_id, category_filter, custom_labels, placeholder '
+            'FROM ticket_panels WHERE message_id IS NOT NULL')
+        self._panels.clear()
+        self._by_message.clear()
+        for panel_id, guild_id, channel_id, message_id, category_filter, custom_labels, placeholder in rows:
+            if owns_guild is None or owns_guild(guild_id):
+                panel = Panel(panel_id, guild_id, channel_id, message_id, category_filter,
+                              json.loads(custom_labels) if custom_labels else {}, placeholder)
+                # Assume the posted message is current; only category changes seen from now on
+                # re-render it, so a restart doesn't cost every panel an edit on its next click
+                panel.rendered_version = self.categories.version(panel.guild_id)
+                self._panels[panel_id] = panel
+                self._by_message[int(message_id)] = panel_id
+        log.info(f"Loaded {len(self._panels)} ticket panels.")
+        return list(self._panels.values())
+
+    async def create(self, guild_id, channel_id, category_filter, custom_labels, placeholder):
+        """Reserve a panel ID; the message ID is attached once the panel is posted."""
+        panel_id = await self.db.execute(
+            'INSERT INTO ticket_panels (guild_id, channel_id, category_filter, custom_labels, placeholder) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (str(guild_id), str(channel_id), str(category_filter) if category_filter else None,
+             json.dumps(custom_labels) if custom_labels else None, placeholder))
+        return Panel(panel_id, guild_id, channel_id, None, category_filter, custom_labels, placeholder)
+
+    async def attach(self, panel, message_id):
+        await self.db.execute('UPDATE ticket_panels SET message_id = ? WHERE panel_id = ?', (str(message_id), panel.panel_id))
+        panel.message_id = int(message_id)
+        self._panels[panel.panel_id] = panel
+        self._by_message[panel.message_id] = panel.panel_id
+
+    async def delete(self, panel):
+        self._panels.pop(panel.panel_id, None)
+        self._by_message.pop(panel.message_id, None)
+        for view in panel.views:
+            view.stop()  # Also unregisters it from discord.py's view store
+        await self.db.execute('DELETE FROM ticket_panels WHERE panel_id = ?', (panel.panel_id,))
+
+    async def forget_messages(self, message_ids):
+        """Drop the panels posted as any of these (deleted) messages."""
+        for message_id in message_ids:
+            panel_id = self._by_message.get(message_id)
+            if panel_id is not None:
+                await self.delete(self._panels[panel_id])
+
+    async def forget_channel(self, channel_id):
+        for panel in [p for p in self._panels.values() if p.channel_id == channel_id]:
+            await self.delete(panel)
+
+    def options(self, guild, panel):
+        """The categories a panel offers right now."""
+        if panel.category_filter is not None:
+            category = self.categories.get(guild, panel.category_filter)
+            return [category] if category is not None else []
+        return self.categories.categories(guild)
+
+    def is_stale(self, panel):
+        return panel.rendered_version != self.categories.version(panel.guild_id)
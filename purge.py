@@ -0,0 +1,272 @@
+"""Message purge pipeline for /clear.
+
+A purge streams the channel's history newest-first and deletes matching
+messages as it goes:
+
+- messages younger than 14 days are deleted in bulk, up to 100 per request
+- older messages can't be bulk-deleted, so they are deleted one at a time with
+  a delay between requests (``PURGE_SINGLE_DELETE_DELAY`` seconds, default 1)
+- a job looks at no more than ``PURGE_SCAN_LIMIT`` messages (default 10000, or
+  the requested amount if larger), which bounds filtered purges
+
+Since history comes newest-first, all bulk-deletable messages come before the
+old ones. After every batch the job's position in the history (the ID of the
+oldest message it has handled) is saved in the ``purge_jobs`` table, so a job
+interrupted by a restart (including a graceful shutdown) picks up from there,
+and ``/clear-cancel`` can stop a running job.
+"""
+import asyncio
+import datetime
+import json
+import logging
+import os
+import time
+
+import discord
+
+log = logging.getLogger(__name__)
+
+BULK_DELETE_LIMIT = 100
+# Discord rejects bulk deletes of messages older than 14 days; keep a small margin
+BULK_DELETE_MAX_AGE = datetime.timedelta(days=14) - datetime.timedelta(minutes=5)
+SINGLE_DELETE_DELAY = float(os.getenv('PURGE_SINGLE_DELETE_DELAY', '1'))
+# A filtered purge stops after looking at this many messages (or ``amount``, if larger),
+# so /clear user:X on a huge channel doesn't walk its whole history
+SCAN_LIMIT = int(os.getenv('PURGE_SCAN_LIMIT', '10000'))
+
+
+def bulk_cutoff():
+    """Messages created after this can still be bulk-deleted. Moves with the clock,
+    since a long purge can outlast the safety margin."""
+    return discord.utils.utcnow() - BULK_DELETE_MAX_AGE
+
+
+class PurgeFilters:
+    def __init__(self, author_id=None, contains=None, bots_only=False, before=None, after=None):
+        self.author_id = author_id
+        self.contains = contains.lower() if contains else None
+        self.bots_only = bots_only
+        self.before = before  # message ID
+        self.after = after    # message ID
+
+    def matches(self, message):
+        if self.author_id is not None and message.author.id != self.author_id:
+            return False
+        if self.bots_only and not message.author.bot:
+            return False
+        if self.contains is not None and self.contains not in message.content.lower():
+            return False
+        return True
+
+    def to_json(self):
+        return json.dumps({'author_id': self.author_id, 'contains': self.contains, 'bots_only': self.bots_only,
+                           'before': self.before, 'after': self.after})
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(**json.loads(data)) if data else cls()
+
+
+class PurgeJob:
+    def __init__(self, job_id, guild_id, channel_id, max_messages, filters, cursor_id=None, deleted=0):
+        self.job_id = job_id
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.max_messages = max_messages
+        self.filters = filters
+        self.cursor_id = cursor_id  # oldest message already handled
+        self.deleted = 0 if deleted is None else deleted
+        self.task = None
+        self.cancelled = False  # set by /clear-cancel, as opposed to a shutdown
+
+
+class PurgeManager:
+    def __init__(self, db):
+        self.db = db
+        self._jobs = {}         # channel_id -> running PurgeJob
+        self._starting = set()  # channel IDs reserved by a /clear that hasn't launched its job yet
+
+    def running(self, channel_id):
+        return self._jobs.get(channel_id)
+
+    def reserve(self, channel_id):
+        """Claim the channel for a new job. False if one is already running or starting.
+
+        Call before the first await, and ``release`` if the job is never started.
+        """
+        if channel_id in self._jobs or channel_id in self._starting:
+            return False
+        self._starting.add(channel_id)
+        return True
+
+    def release(self, channel_id):
+        self._starting.discard(channel_id)
+
+    async def start(self, channel, requested_by, max_messages, filters, on_progress=None):
+        """Create and start a purge job for ``channel``. Returns the job."""
+        job_id = await self.db.execute(
+            "INSERT INTO purge_jobs (guild_id, channel_id, requested_by, max_messages, filters, deleted, status) "
+            "VALUES (?, ?, ?, ?, ?, 0, 'running')",
+            (str(channel.guild.id), str(channel.id), str(requested_by), max_messages, filters.to_json()))
+        job = PurgeJob(job_id, channel.guild.id, channel.id, max_messages, filters)
+        self._launch(job, channel, on_progress)
+        return job
+
+    def _launch(self, job, channel, on_progress):
+        self._jobs[job.channel_id] = job
+        self._starting.discard(job.channel_id)
+        job.task = asyncio.create_task(self._run(job, channel, on_progress))
+        job.task.add_done_callback(lambda _: self._forget(job))
+
+    def _forget(self, job):
+        if self._jobs.get(job.channel_id) is job:
+            del self._jobs[job.channel_id]
+
+    async def cancel(self, channel_id):
+        """Stop the running job in this channel. Returns it, or None if there was none."""
+        job = self._jobs.get(channel_id)
+        if job is None:
+            return None
+        job.cancelled = True
+        job.task.cancel()
+        try:
+            await job.task
+        except asyncio.CancelledError:
+            pass
+        return job
+
+    async def resume(self, bot, owns_guild=None):
+        """Restart jobs left running by a previous process.
+
+        With ``owns_guild`` set, jobs in guilds served by other cluster workers are left to them.
+        """
+        rows = await self.db.fetchall(
+            "SELECT job_id, guild_id, channel_id, max_messages, filters, cursor_id, deleted FROM purge_jobs WHERE status = 'running'")
+        for job_id, guild_id, channel_id, max_messages, filters, cursor_id, deleted in rows:
+            if owns_guild is not None and not owns_guild(guild_id):
+                continue
+            channel = bot.get_channel(int(channel_id))
+            if channel is None:
+                await self._finish(job_id, 'failed')
+                continue
+            if int(channel_id) in self._jobs or int(channel_id) in self._starting:
+                continue
+            job = PurgeJob(job_id, int(guild_id), int(channel_id), max_messages, PurgeFilters.from_json(filters),
+                           int(cursor_id) if cursor_id else None, deleted)
+            log.info(f"Resuming purge job {job_id} in channel {channel_id} ({job.deleted}/{max_messages} deleted)")
+            self._launch(job, channel, None)
+
+    async def _checkpoint(self, job):
+        await self.db.execute("UPDATE purge_jobs SET cursor_id = ?, deleted = ? WHERE job_id = ?",
+                              (str(job.cursor_id) if job.cursor_id else None, job.deleted, job.job_id))
+
+    async def _finish(self, job_id, status):
+        await self.db.execute("UPDATE purge_jobs SET status = ? WHERE job_id = ?", (status, job_id))
+
+    async def _run(self, job, channel, on_progress):
+        last_report = 0.0
+
+        async def report(final=False):
+            nonlocal last_report
+            if on_progress is None:
+                return
+            now = time.monotonic()
+            if final or now - last_report >= 2.0:
+                last_report = now
+                try:
+                    await on_progress(job, final)
+                except Exception:
+                    pass  # The interaction token may have expired; keep purging
+
+        status = 'failed'
+        try:
+            await self._purge(job, channel, report)
+            status = 'done'
+        except asyncio.CancelledError:
+            # Anything but /clear-cancel is the process shutting down: leave the
+            # job 'running' so the next start resumes it
+            status = 'cancelled' if job.cancelled else 'running'
+            raise
+        except Exception as e:
+            log.error(f"Error in purge job {job.job_id}: {e}")
+        finally:
+            try:
+                await asyncio.shield(self._checkpoint(job))
+                if status != 'running':
+                    await asyncio.shield(self._finish(job.job_id, status))
+            except Exception as e:
+                log.error(f"Error saving purge job {job.job_id}: {e}")
+            if status != 'running':
+                await report(final=True)
+
+    async def _purge(self, job, channel, report):
+        filters = job.filters
+        before = job.cursor_id or filters.before
+        history = channel.history(
+            limit=None,
+            before=discord.Object(id=before) if before else None,
+            after=discord.Object(id=filters.after) if filters.after else None,
+            oldest_first=False,
+        )
+        batch = []
+        scanned_id = None  # oldest message seen so far
+        scanned = 0
+        scanned_since_checkpoint = 0
+        scan_limit = max(SCAN_LIMIT, job.max_messages)
+
+        async def delete_one(message):
+            try:
+                await message.delete()
+                job.deleted += 1
+            except discord.NotFound:
+                pass
+            await asyncio.sleep(SINGLE_DELETE_DELAY)
+
+        async def flush():
+            nonlocal batch, scanned_since_checkpoint
+            if batch:
+                # Checked again now: messages can cross the 14 day mark while the batch fills
+                cutoff = bulk_cutoff()
+                fresh = [m for m in batch if m.created_at > cutoff]
+                expired = [m for m in batch if m.created_at <= cutoff]
+                batch = []
+                if fresh:
+                    await channel.delete_messages(fresh)
+                    job.deleted += len(fresh)
+                for message in expired:
+                    await delete_one(message)
+            if scanned_id is not None:
+                job.cursor_id = scanned_id
+            scanned_since_checkpoint = 0
+            await self._checkpoint(job)
+            await report()
+
+        async for message in history:
+            if job.deleted + len(batch) >= job.max_messages:
+                break
+            if scanned >= scan_limit:
+                log.info(f"Purge job {job.job_id} stopped after scanning {scanned} messages")
+                break
+            scanned_id = message.id
+            scanned += 1
+            scanned_since_checkpoint += 1
+            if not filters.matches(message):
+                # Long runs of non-matching messages still move the saved position forward
+                if scanned_since_checkpoint >= 1000 and not batch:
+                    await flush()
+                continue
+            if message.created_at > bulk_cutoff():
+                batch.append(message)
+                if len(batch) >= BULK_DELETE_LIMIT:
+                    await flush()
+                continue
+
+            # Past the 14 day mark: everything from here on is deleted one by one
+            if batch:
+                await flush()
+            await delete_one(message)
+            job.cursor_id = message.id
+            await self._checkpoint(job)
+            await report()
+
+        await flush()
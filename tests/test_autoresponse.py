@@ -0,0 +1,105 @@
+import random
+
+import pytest
+
+from autoresponse import AhoCorasick, GuildMatcher, Trigger, normalize
+
+
+def matcher(*specs):
+    return GuildMatcher(Trigger(i, normalize(text), f'response {i}', mode) for i, (text, mode) in enumerate(specs, 1))
+
+
+def test_normalize():
+    assert normalize('  Hello\n  WORLD \t') == 'hello world'
+
+
+@pytest.mark.parametrize('content, expected', [
+    ('hi', 1),
+    ('Hi there', 1),
+    ('oh, hi!', 1),
+    ('this', None),
+    ('hi_there', None),
+    ('say hi2', None),
+])
+def test_word_boundaries(content, expected):
+    m = matcher(('hi', 'word'))
+    trigger = m.match(content, now=0)
+    assert (trigger.response_id if trigger else None) == expected
+
+
+def test_word_trigger_matches_later_occurrence():
+    m = matcher(('cat', 'word'))
+    assert m.match('concatenate the cat', now=0).response_id == 1
+
+
+def test_contains_matches_inside_words():
+    m = matcher(('cat', 'contains'))
+    assert m.match('concatenate', now=0).response_id == 1
+    assert m.match('dog', now=0) is None
+
+
+def test_exact_mode():
+    m = matcher(('good morning', 'exact'))
+    assert m.match('Good   Morning', now=0).response_id == 1
+    assert m.match('good morning everyone', now=0) is None
+    assert m.match('good', now=0) is None
+
+
+def test_cooldown_skips_to_next_trigger():
+    m = matcher(('hello', 'contains'), ('hello world', 'contains'))
+    m.triggers[1].cooldown = 10
+    m.triggers[1].last_fired = 0
+    assert m.match('hello world', now=5).response_id == 2
+    assert m.match('hello world', now=10).response_id == 1
+
+
+def test_add_replaces_same_text():
+    m = matcher(('ping', 'contains'))
+    m.add(Trigger(2, 'ping', 'pong', 'exact'))
+    assert len(m) == 1
+    assert m.find('PING').response_id == 2
+    assert m.match('ping me', now=0) is None
+    assert m.match('ping', now=0).response_id == 2
+
+
+def test_remove():
+    m = matcher(('foo', 'contains'), ('bar', 'exact'))
+    assert m.remove(1).trigger == 'foo'
+    assert m.remove(1) is None
+    assert m.match('foo', now=0) is None
+    assert m.remove(2).trigger == 'bar'
+    assert m.match('bar', now=0) is None
+    assert len(m) == 0
+
+
+def test_rebuild_after_removals():
+    m = matcher(*((f'word{i}', 'contains') for i in range(10)))
+    for response_id in range(1, 10):
+        m.remove(response_id)
+    # Dead patterns outnumbered live ones, so the automaton was rebuilt
+    assert len(m._automaton) == 1
+    assert m._removed == 0
+    assert m.match('word9', now=0).response_id == 10
+    assert m.match('word1', now=0) is None
+    m.add(Trigger(11, 'word1', 'again', 'contains'))
+    assert m.match('word1', now=0).response_id == 11
+
+
+def test_aho_corasick_matches_brute_force():
+    rng = random.Random(0)
+    patterns = {''.join(rng.choice('ab') for _ in range(rng.randint(1, 4))) for _ in range(20)}
+    automaton = AhoCorasick()
+    for pattern in patterns:
+        automaton.add(pattern, pattern)
+    for _ in range(50):
+        text = ''.join(rng.choice('abc') for _ in range(rng.randint(0, 30)))
+        expected = sorted((i, i + len(p), p) for p in patterns for i in range(len(text)) if text.startswith(p, i))
+        assert sorted(automaton.scan(text)) == expected
+
+
+def test_aho_corasick_add_after_scan():
+    automaton = AhoCorasick()
+    automaton.add('he', 'he')
+    assert list(automaton.scan('she')) == [(1, 3, 'he')]
+    automaton.add('she', 'she')
+    assert sorted(automaton.scan('she')) == [(0, 3, 'she'), (1, 3, 'he')]
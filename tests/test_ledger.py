@@ -0,0 +1,94 @@
+import asyncio
+
+import ledger
+from ledger import COINS, TICKETS, Ledger, LedgerStore
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_balances_survive_reopen(tmp_path):
+    path = str(tmp_path / 'economy.db')
+
+    async def write():
+        book = Ledger(path)
+        await book.open()
+        assert book.record(1, 50) == 50
+        assert book.record(1, -20) == 30
+        book.record(2, 3, TICKETS, issuer_id=9, reason='test')
+        await book.close()
+
+    async def read():
+        book = Ledger(path)
+        await book.open()
+        try:
+            return book.balance(1), book.balance(2, TICKETS), book.balance(3)
+        finally:
+            await book.close()
+
+    run(write())
+    assert run(read()) == (30, 3, 0)
+
+
+def test_snapshot_and_replay(tmp_path, monkeypatch):
+    monkeypatch.setattr(ledger, 'SNAPSHOT_EVERY', 3)
+    path = str(tmp_path / 'economy.db')
+
+    async def write():
+        book = Ledger(path)
+        await book.open()
+        for _ in range(3):
+            book.record(1, 10)
+        await book.flush()  # reaches SNAPSHOT_EVERY, so this one snapshots
+        book.record(1, 5)
+        book.record(2, 7, TICKETS)
+        await book.close()
+
+    run(write())
+
+    store = LedgerStore(path)
+    try:
+        snapshot = dict(((user_id, asset), balance) for user_id, asset, balance in
+                        store.conn.execute('SELECT user_id, asset, balance FROM snapshot_balances'))
+        assert snapshot == {('1', COINS): 30}
+        balances, replayed = store.load_balances()
+        assert replayed == 2  # only the transactions after the snapshot
+        assert balances == {('1', COINS): 35, ('2', TICKETS): 7}
+    finally:
+        store.close()
+
+
+def test_flush_picks_up_other_writers(tmp_path):
+    path = str(tmp_path / 'economy.db')
+
+    async def scenario():
+        first, second = Ledger(path), Ledger(path)
+        await first.open()
+        await second.open()
+        try:
+            first.record(1, 10)
+            await first.flush()
+            second.record(1, 5)
+            await second.flush()
+            await first.flush()
+            return first.balance(1), second.balance(1)
+        finally:
+            await first.close()
+            await second.close()
+
+    assert run(scenario()) == (15, 15)
+
+
+def test_snapshot_skipped_when_behind(tmp_path):
+    path = str(tmp_path / 'economy.db')
+    store, other = LedgerStore(path), LedgerStore(path)
+    try:
+        balances, _ = store.load_balances()
+        other.append([('1', COINS, 10, None, None)])
+        assert not store.snapshot(balances)
+        store.append([])
+        assert store.snapshot({('1', COINS): 10})
+    finally:
+        store.close()
+        other.close()
@@ -0,0 +1,26 @@
+from panels import MAX_SELECTS, OPTIONS_PER_SELECT, paginate, panel_custom_id, parse_custom_id
+
+
+def test_custom_id_round_trip():
+    assert parse_custom_id(panel_custom_id(42, 3)) == (42, 3)
+
+
+def test_parse_custom_id_rejects_others():
+    for custom_id in (None, '', 'ticket_panel', 'ticket_panel:1', 'ticket_panel:1:2:3',
+                      'other:1:2', 'ticket_panel:x:0', 'ticket_panel:1:'):
+        assert parse_custom_id(custom_id) is None
+
+
+def test_paginate():
+    assert paginate([]) == ([], 0)
+    pages, dropped = paginate(list(range(OPTIONS_PER_SELECT + 1)))
+    assert [len(page) for page in pages] == [OPTIONS_PER_SELECT, 1]
+    assert dropped == 0
+
+
+def test_paginate_drops_past_last_select():
+    categories = list(range(OPTIONS_PER_SELECT * MAX_SELECTS + 7))
+    pages, dropped = paginate(categories)
+    assert len(pages) == MAX_SELECTS
+    assert [c for page in pages for c in page] == categories[:OPTIONS_PER_SELECT * MAX_SELECTS]
+    assert dropped == 7
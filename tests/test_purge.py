@@ -0,0 +1,28 @@
+from types import SimpleNamespace
+
+from purge import PurgeFilters
+
+
+def message(author_id=1, bot=False, content=''):
+    return SimpleNamespace(author=SimpleNamespace(id=author_id, bot=bot), content=content)
+
+
+def test_filters_json_round_trip():
+    filters = PurgeFilters(author_id=123, contains='Spam', bots_only=True, before=456, after=789)
+    restored = PurgeFilters.from_json(filters.to_json())
+    assert vars(restored) == vars(filters)
+    assert restored.contains == 'spam'
+
+
+def test_empty_filters_round_trip():
+    assert vars(PurgeFilters.from_json(PurgeFilters().to_json())) == vars(PurgeFilters())
+    assert vars(PurgeFilters.from_json(None)) == vars(PurgeFilters())
+
+
+def test_filters_match():
+    filters = PurgeFilters(author_id=1, contains='buy', bots_only=True)
+    assert filters.matches(message(1, True, 'BUY now'))
+    assert not filters.matches(message(2, True, 'buy now'))
+    assert not filters.matches(message(1, False, 'buy now'))
+    assert not filters.matches(message(1, True, 'hello'))
+    assert PurgeFilters().matches(message())
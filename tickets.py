@@ -0,0 +1,216 @@
+"""In-memory index of open tickets.
+
+The duplicate-ticket check runs on every ticket panel click, so open tickets are
+kept in a per-process dict keyed by ``(guild_id, user_id)``. The index is loaded
+from the ``tickets`` table at startup and written through on every insert and
+close, so the hot path never needs a DB round trip. IDs are kept as strings to
+match how they are stored in the table.
+
+The index is only a fast path. A partial unique index on ``tickets`` (one open
+row per guild and user) is what guarantees one open ticket per user, across
+worker processes too: a ticket is claimed by inserting its row *before* the
+channel is created, and the channel ID is attached afterwards.
+
+``TicketScheduler`` paces channel creation per guild so a burst of clicks
+doesn't run into the channel-create rate limit:
+
+- ``TICKET_CREATE_CONCURRENCY``: channels created at once per guild (default 2)
+- ``TICKET_CREATE_INTERVAL``: minimum seconds between creations in a guild (default 0.5)
+- ``TICKET_QUEUE_LIMIT``: requests waiting per guild before new ones are turned away (default 50)
+"""
+import asyncio
+import logging
+import os
+
+log = logging.getLogger(__name__)
+
+# A claim whose channel never got attached (crash mid-create) stops blocking the user after this long
+STALE_CLAIM_AGE = '-10 minutes'
+
+
+def _is_unique_violation(error):
+    # sqlite3 and sqlitecloud both raise with SQLite's own message
+    return 'UNIQUE constraint failed' in str(error)
+
+
+class OpenTicketIndex:
+    def __init__(self, db):
+        self.db = db
+        self.loaded = False
+        self._by_user = {}     # (guild_id, user_id) -> channel_id
+        self._by_channel = {}  # channel_id -> (guild_id, user_id)
+
+    def __len__(self):
+        return len(self._by_user)
+
+    def _add(self, guild_id, user_id, channel_id):
+        key = (str(guild_id), str(user_id))
+        self._by_user[key] = str(channel_id)
+        self._by_channel[str(channel_id)] = key
+
+    async def load(self, owns_guild=None):
+        """(Re)build the index from every open ticket in the database.
+
+        ``owns_guild(guild_id)`` limits it to the guilds this process serves when
+        running as one worker of a cluster.
+        """
+        await self.db.execute("DELETE FROM tickets WHERE status = 'open' AND channel_id IS NULL "
+                              "AND created_at < datetime('now', ?)", (STALE_CLAIM_AGE,))
+        rows = await self.db.fetchall(
+            "SELECT guild_id, user_id, channel_id FROM tickets WHERE status = 'open' AND channel_id IS NOT NULL")
+        self._by_user.clear()
+        self._by_channel.clear()
+        for guild_id, user_id, channel_id in rows:
+            if owns_guild is None or owns_guild(guild_id):
+                self._add(guild_id, user_id, channel_id)
+        self.loaded = True
+        log.info(f"Loaded {len(self._by_user)} open tickets into the ticket index.")
+
+    async def find_open(self, guild_id, user_id):
+        """Return the channel ID of the user's open ticket in this guild, or None."""
+        if self.loaded:
+            return self._by_user.get((str(guild_id), str(user_id)))
+        # Cold path, used until load() has finished
+        row = await self.db.fetchone(
+            "SELECT channel_id FROM tickets WHERE guild_id = ? AND user_id = ? AND status = 'open' AND channel_id IS NOT NULL",
+            (str(guild_id), str(user_id)))
+        return row[0] if row else None
+
+    async def claim(self, guild_id, user_id, category_name):
+        """Reserve the user's open ticket before its channel is created.
+
+        Returns ``(ticket_id, None)``, or ``(None, channel_id)`` if the user already
+        has an open ticket; ``channel_id`` is None while that one is still being created.
+        """
+        for attempt in range(2):
+            try:
+                ticket_id = await self.db.execute('INSERT INTO tickets (guild_id, user_id, category_name) VALUES (?, ?, ?)',
+                                                  (str(guild_id), str(user_id), category_name))
+                return ticket_id, None
+            except Exception as e:
+                if not _is_unique_violation(e):
+                    raise
+            if attempt == 0:
+                # A claim left behind by a worker that died mid-create; load() only clears these at startup
+                await self.db.execute("DELETE FROM tickets WHERE guild_id = ? AND user_id = ? AND status = 'open' "
+                                      "AND channel_id IS NULL AND created_at < datetime('now', ?)",
+                                      (str(guild_id), str(user_id), STALE_CLAIM_AGE))
+        row = await self.db.fetchone("SELECT channel_id FROM tickets WHERE guild_id = ? AND user_id = ? AND status = 'open'",
+                                     (str(guild_id), str(user_id)))
+        return None, row[0] if row else None
+
+    async def attach(self, ticket_id, guild_id, user_id, channel_id):
+        """Record the channel created for a claimed ticket."""
+        await self.db.execute('UPDATE tickets SET channel_id = ? WHERE ticket_id = ?', (str(channel_id), ticket_id))
+        self._add(guild_id, user_id, channel_id)
+
+    async def release(self, ticket_id):
+        """Drop a claim whose channel could not be created or recorded.
+
+        Deletes by ticket ID alone: this process owns the claim, and a failed
+        ``attach`` may still have written the channel ID before the error.
+        """
+        await self.db.execute('DELETE FROM tickets WHERE ticket_id = ?', (ticket_id,))
+
+    async def close(self, channel_id, closed_by=None, transcript=None):
+        """Mark the ticket in this channel closed. Returns True if it was indexed as open."""
+        was_open = self.forget(channel_id)
+        await self.db.execute(
+            "UPDATE tickets SET status = 'closed', closed_at = CURRENT_TIMESTAMP, closed_by = ?, transcript = ? "
+            "WHERE channel_id = ? AND status = 'open'",
+            (str(closed_by) if closed_by is not None else None, transcript, str(channel_id)))
+        return was_open
+
+    def is_ticket(self, channel_id):
+        return str(channel_id) in self._by_channel
+
+    def owner(self, channel_id):
+        """User ID of the ticket's owner, if the channel is an open ticket."""
+        key = self._by_channel.get(str(channel_id))
+        return key[1] if key else None
+
+    async def open_in_guild(self, guild_id):
+        """Channel IDs of every open ticket in the guild."""
+        if self.loaded:
+            return [channel_id for (g, _), channel_id in self._by_user.items() if g == str(guild_id)]
+        rows = await self.db.fetchall(
+            "SELECT channel_id FROM tickets WHERE guild_id = ? AND status = 'open' AND channel_id IS NOT NULL",
+            (str(guild_id),))
+        return [row[0] for row in rows]
+
+    def forget(self, channel_id):
+        """Drop the index entry for a channel without touching the database."""
+        key = self._by_channel.pop(str(channel_id), None)
+        if key is not None:
+            self._by_user.pop(key, None)
+        return key is not None
+
+
+class TicketQueueFull(Exception):
+    """The guild already has ``TICKET_QUEUE_LIMIT`` ticket requests waiting."""
+
+
+class TicketInProgress(Exception):
+    """The user's previous ticket request is still queued or being created."""
+
+
+class _GuildQueue:
+    __slots__ = ('semaphore', 'pending', 'next_start')
+
+    def __init__(self, concurrency):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.pending = 0        # queued or being created
+        self.next_start = 0.0   # loop time before which the next creation may not start
+
+
+class TicketScheduler:
+    """Runs ticket creations one per user, and a paced few at a time per guild."""
+
+    def __init__(self, concurrency=None, interval=None, limit=None):
+        self.concurrency = concurrency or int(os.getenv('TICKET_CREATE_CONCURRENCY', '2'))
+        self.interval = interval if interval is not None else float(os.getenv('TICKET_CREATE_INTERVAL', '0.5'))
+        self.limit = limit or int(os.getenv('TICKET_QUEUE_LIMIT', '50'))
+        self._guilds = {}
+        self._users = set()  # (guild_id, user_id) with a request queued or running
+
+    def queued(self, guild_id):
+        queue = self._guilds.get(str(guild_id))
+        return queue.pending if queue else 0
+
+    async def submit(self, guild_id, user_id, create, on_queued=None):
+        """Await ``create()`` once a slot in the guild's queue is free and return its result.
+
+        ``on_queued(position)`` is awaited first if the request has to wait behind
+        others. Raises ``TicketInProgress`` or ``TicketQueueFull`` instead of queueing.
+        """
+        user_key = (str(guild_id), str(user_id))
+        if user_key in self._users:
+            raise TicketInProgress()
+        queue = self._guilds.get(str(guild_id))
+        if queue is None:
+            queue = self._guilds[str(guild_id)] = _GuildQueue(self.concurrency)
+        if queue.pending >= self.limit:
+            raise TicketQueueFull()
+
+        # Semaphore waiters are served in order, so this is the number of requests ahead of us
+        position = queue.pending - self.concurrency + 1
+        queue.pending += 1
+        self._users.add(user_key)
+        try:
+            if position > 0 and on_queued is not None:
+                try:
+                    await on_queued(position)
+                except Exception as e:
+                    log.error(f"Error reporting ticket queue position: {e}")
+            async with queue.semaphore:
+                loop = asyncio.get_running_loop()
+                start = max(loop.time(), queue.next_start)
+                queue.next_start = start + self.interval
+                if start > loop.time():
+                    await asyncio.sleep(start - loop.time())
+                return await create()
+        finally:
+            self._users.discard(user_key)
+            queue.pending -= 1
+            if queue.pending == 0:
+                self._guilds.pop(str(guild_id), None)
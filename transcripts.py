@@ -0,0 +1,153 @@
+"""Ticket close pipeline: transcript, close, delete.
+
+Closing a ticket streams the channel's history page by page (oldest first) into
+a gzip-compressed JSON Lines file, so a long ticket is never held in memory as a
+whole. Then it marks the ticket row closed and deletes the channel. The first line
+of a transcript describes the ticket; every other line is one message.
+
+Bulk "close everything inactive for N days" runs go through ``fan_out``, a few
+tickets at a time.
+
+Settings (environment variables):
+
+- ``TRANSCRIPT_DIR``: where transcripts are written (default ``transcripts``),
+  as ``<guild_id>/<channel_id>.jsonl.gz``
+- ``TICKET_CLOSE_CONCURRENCY``: tickets closed at once by a bulk run (default 3)
+"""
+import asyncio
+import datetime
+import gzip
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import discord
+
+from bans import user_label
+from fanout import fan_out
+
+log = logging.getLogger(__name__)
+
+TRANSCRIPT_DIR = os.getenv('TRANSCRIPT_DIR', 'transcripts')
+CLOSE_CONCURRENCY = int(os.getenv('TICKET_CLOSE_CONCURRENCY', '3'))
+
+# Compression and file writes stay off the event loop
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='transcript')
+
+
+def message_record(message):
+    return {
+        'id': str(message.id),
+        'created_at': message.created_at.isoformat(),
+        'author_id': str(message.author.id),
+        'author': user_label(message.author),
+        'content': message.content,
+        'attachments': [attachment.url for attachment in message.attachments],
+        'embeds': [embed.to_dict() for embed in message.embeds],
+    }
+
+
+def _encode(record):
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+def last_activity(channel):
+    """When the last message was sent in the channel, or when it was created if it has none."""
+    snowflake = channel.last_message_id or channel.id
+    return discord.utils.snowflake_time(snowflake)
+
+
+class TicketCloser:
+    def __init__(self, ticket_index, directory=None, concurrency=None):
+        self.ticket_index = ticket_index
+        self.directory = directory or TRANSCRIPT_DIR
+        self.concurrency = concurrency or CLOSE_CONCURRENCY
+        self._closing = set()  # channel IDs with a close in progress
+
+    def transcript_path(self, channel):
+        return os.path.join(self.directory, str(channel.guild.id), f'{channel.id}.jsonl.gz')
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, func, *args)
+
+    async def write_transcript(self, channel, path, header):
+        """Stream the channel's history into ``path``. Returns the number of messages written."""
+        tmp_path = path + '.tmp'
+        await self._run(lambda: os.makedirs(os.path.dirname(path), exist_ok=True))
+        f = await self._run(lambda: gzip.open(tmp_path, 'wt', encoding='utf-8'))
+        count = 0
+        try:
+            await self._run(f.write, _encode(header))
+            buffer = []
+            async for message in channel.history(limit=None, oldest_first=True):
+                buffer.append(_encode(message_record(message)))
+                count += 1
+                # One history page is 100 messages; write as they arrive
+                if len(buffer) >= 100:
+                    await self._run(f.write, ''.join(buffer))
+                    buffer = []
+            if buffer:
+                await self._run(f.write, ''.join(buffer))
+            await self._run(f.close)
+            await self._run(os.replace, tmp_path, path)
+        except BaseException:
+            await self._run(f.close)
+            await self._run(lambda: os.path.exists(tmp_path) and os.remove(tmp_path))
+            raise
+        return count
+
+    async def close(self, channel, closed_by=None, reason=None):
+        """Archive, close and delete a ticket channel. Returns ``(path, message_count)``.
+
+        Returns None if the channel is already being closed.
+        """
+        if channel.id in self._closing:
+            return None
+        self._closing.add(channel.id)
+        try:
+            path = self.transcript_path(channel)
+            header = {
+                'type': 'ticket',
+                'guild_id': str(channel.guild.id),
+                'channel_id': str(channel.id),
+                'channel_name': channel.name,
+                'owner_id': self.ticket_index.owner(channel.id),
+                'closed_by': str(closed_by.id) if closed_by else None,
+                'reason': reason,
+                'archived_at': discord.utils.utcnow().isoformat(),
+            }
+            count = await self.write_transcript(channel, path, header)
+            await self.ticket_index.close(channel.id, closed_by=closed_by.id if closed_by else None, transcript=path)
+            log.info(f"Closed ticket {channel.id}: {count} messages archived to {path}")
+            await channel.delete(reason=reason or "Ticket closed")
+            return path, count
+        finally:
+            self._closing.discard(channel.id)
+
+    async def inactive_tickets(self, guild, days):
+        """Open ticket channels in the guild with no messages for ``days`` days."""
+        cutoff = discord.utils.utcnow() - datetime.timedelta(days=days)
+        channels = []
+        for channel_id in await self.ticket_index.open_in_guild(guild.id):
+            channel = guild.get_channel(int(channel_id))
+            if channel is not None and channel.id not in self._closing and last_activity(channel) < cutoff:
+                channels.append(channel)
+        return channels
+
+    async def close_inactive(self, guild, days, closed_by=None, on_progress=None):
+        """Close every ticket inactive for ``days`` days, a few at a time.
+
+        Returns ``(done, failed, total)`` like ``fanout.apply_overwrite``.
+        """
+        channels = await self.inactive_tickets(guild, days)
+        reason = f"Inactive for {days} days"
+
+        async def close_one(channel):
+            await self.close(channel, closed_by=closed_by, reason=reason)
+
+        done, failed = await fan_out(channels, close_one, concurrency=self.concurrency, on_progress=on_progress)
+        for channel, error in failed:
+            log.error(f"Error closing inactive ticket {channel.id}: {error}")
+        return done, failed, len(channels)